@@ -1,9 +1,22 @@
+import base64
+import json
+from urllib import urlencode
+
 from django.conf import settings
 from tastypie import paginator
+from tastypie.exceptions import BadRequest
 
 
 class Paginator(paginator.Paginator):
-    """Paginator with a hard limit on results per page."""
+    """Paginator with a hard limit on results per page.
+
+    Results are paged either with limit and offset, with the offset
+    capped to MAX_API_OFFSET, or, when a `cursor` parameter is given,
+    with opaque cursors that continue after the id of the last result
+    of the previous page. Cursors cost the same for every page, start
+    with an empty `cursor` and are returned in meta['next'].
+
+    """
 
     def get_limit(self):
         """Determines the proper maximum number of results to return.
@@ -23,8 +36,60 @@ class Paginator(paginator.Paginator):
     def get_offset(self):
         """Determines the proper starting offset of results to return.
 
-        Returns minimum value of offset as calculated by
-        tastypie.paginator.Paginator and total objects to prevent
-        Elastic Search crashes and timeouts.
+        Offsets above MAX_API_OFFSET, 10000 by default, are refused to
+        prevent Elastic Search timeouts on deep pages; use cursors
+        instead.
+
         """
-        return min(super(Paginator, self).get_offset(), self.get_count())
+        offset = super(Paginator, self).get_offset()
+        max_offset = getattr(settings, 'MAX_API_OFFSET', 10000)
+        if offset > max_offset:
+            raise BadRequest('Offset can not be more than %d, use cursor '
+                             'pagination instead.' % max_offset)
+        return offset
+
+    def page(self):
+        if 'cursor' not in self.request_data:
+            return super(Paginator, self).page()
+
+        limit = self.get_limit()
+        last_id = decode_cursor(self.request_data['cursor'])
+        objects = list(self.objects.filter(id__gt=last_id)
+                       .order_by('id')[:limit])
+
+        next_uri = None
+        if objects and len(objects) == limit:
+            next_uri = self._generate_cursor_uri(
+                limit, encode_cursor(objects[-1].id))
+
+        return {
+            'objects': objects,
+            'meta': {'limit': limit,
+                     'next': next_uri,
+                     'previous': None}}
+
+    def _generate_cursor_uri(self, limit, cursor):
+        if self.resource_uri is None:
+            return None
+
+        params = {}
+        for key, value in self.request_data.items():
+            if key not in ('offset', 'cursor'):
+                params[key] = unicode(value).encode('utf-8')
+        params.update({'limit': limit, 'cursor': cursor})
+        return '%s?%s' % (self.resource_uri, urlencode(params))
+
+
+def encode_cursor(last_id):
+    """Return the cursor of the page after object `last_id`."""
+    return base64.urlsafe_b64encode(json.dumps({'id': last_id}))
+
+
+def decode_cursor(cursor):
+    """Return the id of the last object before `cursor`."""
+    if not cursor:
+        return 0
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(str(cursor)))['id'])
+    except (TypeError, ValueError, KeyError):
+        raise BadRequest('Invalid cursor.')
@@ -0,0 +1,38 @@
+import time
+
+from django.core.cache import cache
+
+GENERATION_KEY = 'generation:%s'
+# memcached treats longer timeouts as timestamps.
+GENERATION_TIMEOUT = 30 * 24 * 3600
+
+
+def _new_generation():
+    # Seeding from the clock keeps a generation evicted from the cache
+    # from coming back with a value that was already used.
+    return int(time.time() * 1000)
+
+
+def get_generation(name):
+    """Return the current generation of `name`.
+
+    Include it in cache keys to invalidate all of them at once with
+    bump_generation().
+
+    """
+    key = GENERATION_KEY % name
+    generation = cache.get(key)
+    if generation is None:
+        generation = _new_generation()
+        if not cache.add(key, generation, GENERATION_TIMEOUT):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def bump_generation(name):
+    """Invalidate all cache keys built on the generation of `name`."""
+    key = GENERATION_KEY % name
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_generation(), GENERATION_TIMEOUT)
@@ -0,0 +1,79 @@
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+
+# Zero runs everything inline, e.g. in tests where the data lives in a
+# transaction other connections can't see.
+BACKGROUND_WORKERS = getattr(settings, 'BACKGROUND_WORKERS', 4)
+# Connections of workers idle for longer are checked before use, as
+# the server may have closed them.
+BACKGROUND_CONNECTION_CHECK_AFTER = getattr(
+    settings, 'BACKGROUND_CONNECTION_CHECK_AFTER', 60)
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+class _Result(object):
+    """Result of a call that already ran."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self, timeout=None):
+        return self.value
+
+
+def _check_connections():
+    """Close the connections of this thread that the server dropped."""
+    now = time.time()
+    last_call = getattr(_local, 'last_call', None)
+    _local.last_call = now
+    if (last_call is not None and
+        now - last_call < BACKGROUND_CONNECTION_CHECK_AFTER):
+        return
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        try:
+            connection.cursor().execute('SELECT 1')
+            transaction.rollback_unless_managed(using=connection.alias)
+        except DatabaseError:
+            # The next query opens a new connection.
+            connection.close()
+
+
+def _call(func, args):
+    _check_connections()
+    try:
+        result = func(*args)
+    except:
+        # The connections may be left in a broken state.
+        for connection in connections.all():
+            connection.close()
+        raise
+    # Workers keep their connections between calls, but must not keep
+    # the snapshot of the transactions the calls opened.
+    for alias in connections:
+        transaction.rollback_unless_managed(using=alias)
+    return result
+
+
+def submit(func, *args):
+    """Run `func(*args)` on the background worker pool.
+
+    Return an object whose get() method waits for and returns the
+    result of the call.
+
+    """
+    global _pool
+    if not BACKGROUND_WORKERS:
+        return _Result(func(*args))
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(BACKGROUND_WORKERS)
+    return _pool.apply_async(_call, (func, args))
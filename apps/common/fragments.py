@@ -0,0 +1,63 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import translation
+
+from django_statsd.clients import statsd
+from jinja2 import Markup, nodes
+from jinja2.ext import Extension
+
+from apps.common.cache import bump_generation, get_generation
+
+FRAGMENT_GENERATION = 'fragments:%s'
+FRAGMENT_CACHE_KEY = 'fragments:%s:%d:%s'
+FRAGMENT_CACHE_TIMEOUT = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 600)
+
+
+def invalidate_fragments(name):
+    """Forget all cached renderings of fragment `name`."""
+    bump_generation(FRAGMENT_GENERATION % name)
+
+
+class FragmentCacheExtension(Extension):
+    """Cache template fragments.
+
+    Usage::
+
+        {% cache 'curated_groups', version %}
+          ...
+        {% endcache %}
+
+    The first argument names the fragment, the others are the values
+    its rendering depends on, such as a version. Renderings are also
+    kept per language. invalidate_fragments() forgets all renderings
+    of a fragment at once. Hits and misses are counted per fragment
+    name.
+
+    """
+    tags = set(['cache'])
+
+    def parse(self, parser):
+        lineno = parser.stream.next().lineno
+        name = parser.parse_expression()
+        args = []
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        call = self.call_method('_render', [name, nodes.List(args)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, name, args, caller):
+        params = repr((translation.get_language(), args))
+        key = FRAGMENT_CACHE_KEY % (
+            name, get_generation(FRAGMENT_GENERATION % name),
+            hashlib.md5(params).hexdigest())
+        rendered = cache.get(key)
+        if rendered is not None:
+            statsd.incr('fragments.%s.hit' % name)
+        else:
+            statsd.incr('fragments.%s.miss' % name)
+            rendered = unicode(caller())
+            cache.set(key, rendered, FRAGMENT_CACHE_TIMEOUT)
+        return Markup(rendered)
@@ -57,7 +57,12 @@ def bootstrap(element):
 
 @register.function
 def get_privacy_level(user):
-    """Return privacy level user."""
+    """Return privacy level user.
+
+    The level is memoized on user.userprofile, so repeated calls
+    during a request don't hit the database.
+
+    """
     from apps.users.models import PUBLIC
     if not user.is_authenticated():
         return PUBLIC
@@ -10,7 +10,8 @@ from django.utils.encoding import iri_to_uri
 from django.shortcuts import redirect
 from tower import ugettext as _
 
-from apps.groups.models import Group, GroupAlias
+from apps.groups.aliases import get_alias_map
+from apps.groups.models import Group
 
 LOGIN_MESSAGE = _('You must be logged in to continue.')
 GET_VOUCHED_MESSAGE = _('You must be vouched to continue.')
@@ -87,15 +88,14 @@ class OldGroupRedirectionMiddleware(object):
     def process_response(self, request, response):
         group_url = re.match('^/group/(?P<id>\d+)-(?P<url>[-\w]+)/$',
                              request.path_info)
-        if (response.status_code == 404
-            and group_url
-            and (Group.objects.filter(url=group_url.group('url')).exists())):
-
-            newurl = reverse('group', args=[group_url.group('url')])
-            if request.GET:
-                with safe_query_string(request):
-                    newurl += '?' + request.META['QUERY_STRING']
-            return HttpResponseRedirect(newurl)
+        if response.status_code == 404 and group_url:
+            group = get_alias_map(Group).resolve_url(group_url.group('url'))
+            if group:
+                newurl = reverse('group', args=[group[1]])
+                if request.GET:
+                    with safe_query_string(request):
+                        newurl += '?' + request.META['QUERY_STRING']
+                return HttpResponseRedirect(newurl)
         return response
 
 
@@ -104,17 +104,14 @@ class GroupAliasRedirectionMiddleware(object):
 
     def process_response(self, request, response):
         group_url = re.match('^/group/(?P<url>[-\w]+)/$', request.path_info)
-        if (response.status_code == 404
-            and group_url
-            and (GroupAlias.objects.filter(url=group_url.group('url'))
-                 .exists())):
-
-            group_alias = GroupAlias.objects.get(url=group_url.group('url'))
-            newurl = reverse('group', args=[group_alias.alias.url])
-            if request.GET:
-                with safe_query_string(request):
-                    newurl += '?' + request.META['QUERY_STRING']
-            return HttpResponseRedirect(newurl)
+        if response.status_code == 404 and group_url:
+            group = get_alias_map(Group).resolve_url(group_url.group('url'))
+            if group and group[1] != group_url.group('url'):
+                newurl = reverse('group', args=[group[1]])
+                if request.GET:
+                    with safe_query_string(request):
+                        newurl += '?' + request.META['QUERY_STRING']
+                return HttpResponseRedirect(newurl)
         return response
 
 
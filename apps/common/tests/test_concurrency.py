@@ -0,0 +1,47 @@
+from django import test
+from django.db import DatabaseError
+
+from mock import MagicMock, patch
+from nose.tools import assert_raises, eq_
+
+from apps.common import concurrency
+
+
+def _double(value):
+    return value * 2
+
+
+def _fail():
+    raise ValueError('foo')
+
+
+class SubmitTests(test.TestCase):
+
+    def tearDown(self):
+        if concurrency._pool is not None:
+            concurrency._pool.terminate()
+            concurrency._pool = None
+
+    @patch('apps.common.concurrency.BACKGROUND_WORKERS', 1)
+    def test_pool(self):
+        """Test that results and exceptions come back through get()."""
+        concurrency._pool = None
+        result = concurrency.submit(_double, 21)
+        failure = concurrency.submit(_fail)
+
+        eq_(result.get(), 42)
+        assert_raises(ValueError, failure.get)
+        eq_(concurrency.submit(_double, 'a').get(), 'aa')
+
+    @patch('apps.common.concurrency.BACKGROUND_CONNECTION_CHECK_AFTER', 0)
+    @patch('apps.common.concurrency.connections')
+    def test_dead_connection(self, connections_mock):
+        """Test that connections the server dropped are replaced."""
+        connection = MagicMock()
+        connection.cursor.return_value.execute.side_effect = DatabaseError(
+            2006, 'MySQL server has gone away')
+        connections_mock.all.return_value = [connection]
+        connections_mock.__iter__.return_value = iter([])
+
+        eq_(concurrency._call(_double, (21,)), 42)
+        connection.close.assert_called_once_with()
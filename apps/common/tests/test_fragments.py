@@ -0,0 +1,24 @@
+from django import test
+
+import jingo
+from nose.tools import eq_
+
+from apps.common.fragments import invalidate_fragments
+
+
+class FragmentCacheTests(test.TestCase):
+
+    def test_cache(self):
+        """Test that fragments are cached until invalidated."""
+        template = jingo.env.from_string(
+            '{% cache "test_fragment", version %}'
+            '<b>{{ name }}</b>'
+            '{% endcache %}')
+        invalidate_fragments('test_fragment')
+
+        eq_(template.render(name='foo', version=1), '<b>foo</b>')
+        eq_(template.render(name='bar', version=1), '<b>foo</b>')
+        eq_(template.render(name='<bar>', version=2), '<b>&lt;bar&gt;</b>')
+
+        invalidate_fragments('test_fragment')
+        eq_(template.render(name='bar', version=1), '<b>bar</b>')
@@ -2,7 +2,6 @@ from django import forms
 from django.contrib import admin
 from django.contrib.admin import SimpleListFilter
 from django.contrib.admin.widgets import FilteredSelectMultiple
-from django.db.models import Count
 
 import autocomplete_light
 
@@ -24,10 +23,9 @@ class EmptyGroupFilter(SimpleListFilter):
         if self.value() is None:
             return queryset
         value = self.value() == 'True'
-        queryset = (queryset.annotate(no_profiles=Count('members')))
         if value:
-            return queryset.filter(no_profiles__gt=0)
-        return queryset.filter(no_profiles=0)
+            return queryset.filter(member_count__gt=0)
+        return queryset.filter(member_count=0)
 
 
 class CurratedGroupFilter(SimpleListFilter):
@@ -69,7 +67,7 @@ class GroupBaseAdmin(admin.ModelAdmin):
     list_display = ['name', 'member_count']
     list_display_links = ['name']
     list_filter = [EmptyGroupFilter]
-    readonly_fields = ['url']
+    readonly_fields = ['url', 'member_count']
 
     def get_form(self, request, obj=None, **kwargs):
         defaults = {}
@@ -78,15 +76,6 @@ class GroupBaseAdmin(admin.ModelAdmin):
         defaults.update(kwargs)
         return super(GroupBaseAdmin, self).get_form(request, obj, **defaults)
 
-    def queryset(self, request):
-        return (super(GroupBaseAdmin, self)
-                .queryset(request).annotate(member_count=Count('members')))
-
-    def member_count(self, obj):
-        """Return number of members in group."""
-        return obj.member_count
-    member_count.admin_order_field = 'member_count'
-
 
 class GroupAliasInline(admin.StackedInline):
     model = GroupAlias
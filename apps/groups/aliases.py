@@ -0,0 +1,106 @@
+import threading
+
+from apps.common.cache import bump_generation, get_generation
+
+ALIASES_GENERATION = 'groups:aliases:%s'
+
+
+class AliasMap(object):
+    """In-process map of the aliases of a tag model to their tags.
+
+    Maps alias names to tag ids, and both tag and alias urls to the id
+    and url of their tag. The map is loaded on first use and reloaded
+    when the generation bumped by invalidate() changes, which is
+    checked on every lookup. Only renames and deletions invalidate the
+    map; names and urls it misses are looked up in the database and
+    added to it, which covers tags and aliases created since the load.
+
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.generation_name = ALIASES_GENERATION % model.__name__
+        self._lock = threading.Lock()
+        self._names = {}
+        self._urls = {}
+        self._generation = None
+
+    def invalidate(self):
+        """Make all processes reload their map of this model."""
+        bump_generation(self.generation_name)
+
+    def _refresh(self):
+        generation = get_generation(self.generation_name)
+        if generation == self._generation:
+            return
+        with self._lock:
+            if generation != self._generation:
+                self._names, self._urls = self._load()
+                self._generation = generation
+
+    def _load(self):
+        alias_model = self.model.aliases.related.model
+        urls = {}
+        names = {}
+        for name, url, tag_id, tag_url in (
+                alias_model.objects
+                .values_list('name', 'url', 'alias', 'alias__url')):
+            names[name] = tag_id
+            urls[url] = (tag_id, tag_url)
+        # Tag urls win over alias urls, as they do in the views.
+        for tag_id, tag_url in self.model.objects.values_list('id', 'url'):
+            urls[tag_url] = (tag_id, tag_url)
+        return names, urls
+
+    def resolve_names(self, names):
+        """Return a dict mapping those of the lowercase `names` that are
+        aliases to the id of their tag.
+
+        """
+        self._refresh()
+        mapping = self._names
+        resolved = dict((name, mapping[name]) for name in names
+                        if name in mapping)
+        missing = set(names) - set(resolved)
+        if missing:
+            alias_model = self.model.aliases.related.model
+            found = dict(alias_model.objects.filter(name__in=missing)
+                         .values_list('name', 'alias'))
+            with self._lock:
+                self._names.update(found)
+            resolved.update(found)
+        return resolved
+
+    def resolve_url(self, url):
+        """Return the id and url of the tag with url or alias url `url`,
+        or None.
+
+        """
+        self._refresh()
+        tag = self._urls.get(url)
+        if tag is None:
+            tag = self._lookup_url(url)
+            if tag is not None:
+                with self._lock:
+                    self._urls[url] = tag
+        return tag
+
+    def _lookup_url(self, url):
+        tags = self.model.objects.filter(url=url).values_list('id', 'url')
+        if not tags:
+            alias_model = self.model.aliases.related.model
+            tags = (alias_model.objects.filter(url=url)
+                    .values_list('alias', 'alias__url'))
+        return tags[0] if tags else None
+
+
+_maps = {}
+_maps_lock = threading.Lock()
+
+
+def get_alias_map(model):
+    """Return the alias map of tag model `model`."""
+    with _maps_lock:
+        if model not in _maps:
+            _maps[model] = AliasMap(model)
+        return _maps[model]
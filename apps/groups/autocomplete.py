@@ -0,0 +1,94 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from apps.common.cache import bump_generation, get_generation
+
+AUTOCOMPLETE_GENERATION = 'groups:autocomplete:%s'
+# How often, in seconds, an index checks whether it's out of date.
+CHECK_INTERVAL = getattr(settings, 'AUTOCOMPLETE_INDEX_CHECK_INTERVAL', 5)
+
+
+class PrefixIndex(object):
+    """In-process prefix index of the auto-completable names of a tag
+    model.
+
+    Every word suffix of the tag names and of their aliases is kept in
+    a sorted array along with the tag name, so that lookups are a
+    binary search. The index is loaded on first use and reloaded when
+    the generation bumped by invalidate() changes.
+
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.generation_name = AUTOCOMPLETE_GENERATION % model.__name__
+        self._lock = threading.Lock()
+        self._entries = []
+        self._generation = None
+        self._checked = 0
+
+    def invalidate(self):
+        """Make all processes reload their index of this model."""
+        bump_generation(self.generation_name)
+
+    def _refresh(self):
+        if time.time() - self._checked < CHECK_INTERVAL:
+            return
+        with self._lock:
+            if time.time() - self._checked < CHECK_INTERVAL:
+                return
+            generation = get_generation(self.generation_name)
+            if generation != self._generation:
+                self._entries = self._load()
+                self._generation = generation
+            self._checked = time.time()
+
+    def _load(self):
+        alias_model = self.model.aliases.related.model
+        rows = (list(self.model.objects.filter(auto_complete=True)
+                     .values_list('name', 'name')) +
+                list(alias_model.objects.filter(alias__auto_complete=True)
+                     .values_list('name', 'alias__name')))
+        entries = set()
+        for key, name in rows:
+            words = key.lower().split()
+            for i in range(len(words)):
+                entries.add((u' '.join(words[i:]), name))
+        return sorted(entries)
+
+    def search(self, term):
+        """Return the names of the tags with a word of their name or of
+        an alias starting with `term`.
+
+        """
+        term = u' '.join(term.lower().split())
+        if not term:
+            return []
+        self._refresh()
+
+        entries = self._entries
+        names = []
+        seen = set()
+        i = bisect_left(entries, (term,))
+        while i < len(entries) and entries[i][0].startswith(term):
+            name = entries[i][1]
+            if name not in seen:
+                seen.add(name)
+                names.append(name)
+            i += 1
+        return names
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_prefix_index(model):
+    """Return the prefix index of tag model `model`."""
+    with _indexes_lock:
+        if model not in _indexes:
+            _indexes[model] = PrefixIndex(model)
+        return _indexes[model]
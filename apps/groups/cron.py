@@ -1,11 +1,15 @@
+import time
+
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models import Count
 
 import commonware.log
 import cronjobs
+from django_statsd.clients import statsd
 
+from autocomplete import get_prefix_index
 from models import AUTO_COMPLETE_COUNT, Group, Skill, Language
+from utils import chunked_ids
 
 
 log = commonware.log.getLogger('m.cron')
@@ -16,25 +20,38 @@ def assign_autocomplete_to_groups():
     """Hourly job to assign autocomplete status to Mozillian popular
     groups, languages, and skills.
 
+    Flags are flipped with bulk updates of the tags whose status
+    changes, in chunks.
+
     """
-    # Only assign status to non-system groups.
-    # TODO: add stats.d timer here
-    for g in (Group.objects.filter(always_auto_complete=False, system=False)
-                           .annotate(count=Count('members'))):
-        g.auto_complete = g.count > AUTO_COMPLETE_COUNT
-        g.save()
-
-    # Assign appropriate status to skills
-    for g in (Skill.objects.filter(always_auto_complete=False)
-                           .annotate(count=Count('members'))):
-        g.auto_complete = g.count > AUTO_COMPLETE_COUNT
-        g.save()
-
-    # Assign appropriate status to languages spoken
-    for g in (Language.objects.filter(always_auto_complete=False)
-                              .annotate(count=Count('members'))):
-        g.auto_complete = g.count > AUTO_COMPLETE_COUNT
-        g.save()
+    start = time.time()
+    updated = 0
+    for model in [Group, Skill, Language]:
+        tags = model.objects.filter(always_auto_complete=False)
+        if model is Group:
+            # Only assign status to non-system groups.
+            tags = tags.filter(system=False)
+
+        count = 0
+        for auto_complete, popular in [
+                (True, tags.filter(auto_complete=False,
+                                   member_count__gt=AUTO_COMPLETE_COUNT)),
+                (False, tags.filter(auto_complete=True,
+                                    member_count__lte=AUTO_COMPLETE_COUNT))]:
+            for ids in chunked_ids(popular):
+                count += (model.objects.filter(id__in=ids)
+                          .update(auto_complete=auto_complete))
+        if count:
+            # Bulk updates don't send the signals that do this.
+            get_prefix_index(model).invalidate()
+        updated += count
+
+    duration = time.time() - start
+    statsd.gauge('groups.assign_autocomplete.updated', updated)
+    statsd.timing('groups.assign_autocomplete.duration',
+                  int(duration * 1000))
+    log.info('Updated autocomplete status of %d tags in %.1fs.'
+             % (updated, duration))
 
 
 @cronjobs.register
@@ -51,3 +68,13 @@ def assign_staff_to_early_users():
 
     for u in staff_users:
         u.get_profile().groups.add(staff)
+
+
+@cronjobs.register
+def update_member_counts():
+    """Recount the members of all groups, languages and skills,
+    fixing any drift of the maintained counts. Run on every deploy.
+
+    """
+    for model in [Group, Skill, Language]:
+        model.update_member_counts()
@@ -5,10 +5,22 @@ from south.db import db
 from south.v2 import DataMigration
 from django.db import models
 
-from ..utils import merge_groups
-
 _logger = logging.getLogger('south')
 
+
+def merge_groups(master_group, group_list):
+    """Merge group_list into master_group.
+
+    A copy of the merge at the time of this migration, which works
+    with frozen models.
+
+    """
+    for group in group_list:
+        map(lambda x: master_group.members.add(x),
+            group.members.values_list('id', flat=True))
+        group.aliases.update(alias=master_group)
+        group.delete()
+
 class Migration(DataMigration):
 
     def forwards(self, orm):
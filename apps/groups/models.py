@@ -1,10 +1,15 @@
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import connection, models, transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 from autoslug.fields import AutoSlugField
 from tower import ugettext_lazy as _lazy
 
+from apps.common.fragments import invalidate_fragments
+
+from aliases import get_alias_map
+from autocomplete import get_prefix_index
+
 # If three or more users use a group, it will get auto-completed.
 AUTO_COMPLETE_COUNT = 3
 
@@ -21,10 +26,89 @@ class GroupBase(models.Model):
     # autocomplete list.
     auto_complete = models.BooleanField(db_index=True, default=False)
     always_auto_complete = models.BooleanField(default=False)
+    # Maintained by update_member_counts().
+    member_count = models.PositiveIntegerField(db_index=True, default=0,
+                                               editable=False)
 
     class Meta:
         abstract = True
 
+    def save(self, *args, **kwargs):
+        self._url_changed = False
+        if self.pk is not None:
+            stored = (type(self).objects.filter(pk=self.pk)
+                      .values_list('member_count', 'url'))
+            if stored:
+                # member_count is only changed by queryset updates;
+                # don't overwrite it with the value this instance was
+                # loaded with.
+                self.member_count, url = stored[0]
+                # Tags get their first url on their second save.
+                self._url_changed = bool(url) and url != self.url
+        super(GroupBase, self).save(*args, **kwargs)
+
+    @classmethod
+    def create_with_aliases(cls, names):
+        """Create tags for `names` along with their aliases in bulk.
+
+        Return a dict mapping each name to the id of its new tag.
+
+        """
+        alias_model = cls.aliases.related.model
+        url_field = alias_model._meta.get_field('url')
+        aliases = []
+        urls = set()
+        for name in names:
+            alias = alias_model(name=name.lower())
+            url = original_url = url_field.pre_save(alias, add=True)
+            # Slugs of this batch are not in the database yet.
+            index = 1
+            while url in urls:
+                index += 1
+                alias.url = '%s-%d' % (original_url, index)
+                url = url_field.pre_save(alias, add=True)
+            urls.add(url)
+            aliases.append(alias)
+
+        cls.objects.bulk_create([cls(name=alias.name, url=alias.url)
+                                 for alias in aliases])
+        ids = dict(cls.objects.filter(name__in=[a.name for a in aliases])
+                   .values_list('name', 'id'))
+        for alias in aliases:
+            alias.alias_id = ids[alias.name]
+        alias_model.objects.bulk_create(aliases)
+        get_prefix_index(cls).invalidate()
+        return ids
+
+    @classmethod
+    def update_member_counts(cls, ids=None):
+        """Recount the members of tags `ids`, or of all tags.
+
+        Counts are computed by the database in a single UPDATE, so
+        they are exact whatever the membership changes were.
+
+        """
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                return
+
+        qn = connection.ops.quote_name
+        field = cls.members.related.field
+        through = field.rel.through._meta.db_table
+        table = cls._meta.db_table
+        sql = ('UPDATE %(table)s SET member_count = '
+               '(SELECT COUNT(*) FROM %(through)s '
+               'WHERE %(through)s.%(column)s = %(table)s.id)'
+               % {'table': qn(table), 'through': qn(through),
+                  'column': qn(field.m2m_reverse_name())})
+        params = []
+        if ids is not None:
+            sql += ' WHERE id IN (%s)' % ', '.join(['%s'] * len(ids))
+            params = ids
+        connection.cursor().execute(sql, params)
+        transaction.commit_unless_managed()
+
     @classmethod
     def search(cls, query, auto_complete_only=True):
         if query:
@@ -66,8 +150,7 @@ class Group(GroupBase):
     @classmethod
     def get_curated(cls):
         """Return all the groups with a steward assigned."""
-        return cls.objects.exclude(steward=None).annotate(
-            num_users=models.Count('members'))
+        return cls.objects.exclude(steward=None)
 
     class Meta:
         db_table = 'group'
@@ -132,3 +215,43 @@ class LanguageAlias(GroupAliasBase):
 
     class Meta:
         verbose_name_plural = 'language aliases'
+
+
+def invalidate_tag_model_caches(model, alias_map=True):
+    """Reload the autocomplete index of tag model `model` and the
+    curated group list of the home page, and its alias map unless
+    `alias_map` is False.
+
+    """
+    get_prefix_index(model).invalidate()
+    if alias_map:
+        get_alias_map(model).invalidate()
+    if model is Group:
+        invalidate_fragments('curated_groups')
+
+
+def invalidate_tag_caches(sender, instance, signal, **kwargs):
+    """Invalidate the caches of a tag model after changes to its tags
+    or their aliases. Alias maps are only reloaded after renames and
+    deletions.
+
+    """
+    if issubclass(sender, GroupAliasBase):
+        tag_model = sender._meta.get_field('alias').rel.to
+        # An existing alias was renamed or moved to another tag.
+        stale = not kwargs.get('created')
+    else:
+        tag_model = sender
+        stale = getattr(instance, '_url_changed', False)
+    # The alias map looks up what it misses, so new tags and aliases
+    # don't make it stale.
+    invalidate_tag_model_caches(tag_model,
+                                alias_map=stale or signal is post_delete)
+
+for model in (Group, GroupAlias, Skill, SkillAlias, Language, LanguageAlias):
+    post_save.connect(invalidate_tag_caches, sender=model,
+                      dispatch_uid='invalidate_tag_caches_save_%s_sig'
+                      % model.__name__)
+    post_delete.connect(invalidate_tag_caches, sender=model,
+                        dispatch_uid='invalidate_tag_caches_delete_%s_sig'
+                        % model.__name__)
@@ -1,12 +1,42 @@
+import time
+
+import commonware.log
 from celery.task import task
-from django.db.models import Count
+from django.db import transaction
+from django_statsd.clients import statsd
+
+from models import Group, Language, Skill, invalidate_tag_model_caches
+from utils import chunked_ids
 
-from models import Group, Skill
+
+log = commonware.log.getLogger('m.groups')
 
 
 @task
 def remove_empty_groups():
-    """Remove empty groups."""
-    for model in [Group, Skill]:
-        (model.objects
-         .annotate(mcount=Count('members')).filter(mcount=0).delete())
+    """Remove empty groups, skills and languages, in chunks."""
+    start = time.time()
+    deleted = 0
+    for model in [Group, Skill, Language]:
+        alias_model = model.aliases.related.model
+        # Double check against the memberships, in case a count is off.
+        empty = model.objects.filter(member_count=0, members=None)
+        model_deleted = 0
+        for ids in chunked_ids(empty):
+            # Raw deletes don't send signals for every row; caches are
+            # invalidated once per model instead. Empty tags have
+            # nothing but aliases pointing to them.
+            with transaction.commit_on_success():
+                aliases = alias_model.objects.filter(alias__in=ids)
+                aliases._raw_delete(aliases.db)
+                tags = model.objects.filter(id__in=ids)
+                tags._raw_delete(tags.db)
+            model_deleted += len(ids)
+        if model_deleted:
+            invalidate_tag_model_caches(model)
+        deleted += model_deleted
+
+    duration = time.time() - start
+    statsd.gauge('groups.remove_empty.deleted', deleted)
+    statsd.timing('groups.remove_empty.duration', int(duration * 1000))
+    log.info('Removed %d empty tags in %.1fs.' % (deleted, duration))
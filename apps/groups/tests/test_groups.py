@@ -5,11 +5,15 @@ import json
 from django.contrib.auth.models import User
 
 from funfactory.urlresolvers import reverse
+from mock import patch
 from nose.tools import eq_
 from pyquery import PyQuery as pq
 
 import apps.common.tests.init
+from apps.common.cache import get_generation
 
+from ..aliases import get_alias_map
+from ..autocomplete import get_prefix_index
 from ..cron import assign_autocomplete_to_groups
 from ..helpers import stringify_groups
 from ..models import AUTO_COMPLETE_COUNT, Group, GroupAlias
@@ -238,6 +242,105 @@ class GroupTest(apps.common.tests.init.ESTestCase):
                 'User should not be in the "%s" group' %
                 self.SYSTEM_GROUP.name)
 
+    def test_prefix_index(self):
+        """Test the in-process group autocomplete index."""
+        Group.objects.create(name='open web', auto_complete=True)
+        web = Group.objects.create(name='webdev', auto_complete=True)
+        GroupAlias.objects.create(name='web developers', alias=web)
+        Group.objects.create(name='webmaker')
+
+        index = get_prefix_index(Group)
+        eq_(index.search(u'  WEB '), ['open web', 'webdev'])
+        eq_(index.search(u'develop'), ['webdev'])
+        eq_(index.search(u'open w'), ['open web'])
+        eq_(index.search(u'nope'), [])
+
+        with patch('apps.groups.autocomplete.CHECK_INTERVAL', 60):
+            with self.assertNumQueries(0):
+                index.search(u'web')
+
+    def test_alias_map(self):
+        """Test the in-process group alias map."""
+        alias_map = get_alias_map(Group)
+        group = self.NORMAL_GROUP
+        eq_(alias_map.resolve_names(['cheesezilla', 'nope']),
+            {'cheesezilla': group.id})
+        eq_(alias_map.resolve_url(group.url), (group.id, group.url))
+        eq_(alias_map.resolve_url('nope'), None)
+
+        # New tags and aliases are looked up without reloading the map.
+        generation = get_generation(alias_map.generation_name)
+        alias = GroupAlias.objects.create(name='cheese', alias=group)
+        new_group = Group.objects.create(name='cheddar')
+        eq_(get_generation(alias_map.generation_name), generation)
+        eq_(alias_map.resolve_names(['cheese']), {'cheese': group.id})
+        eq_(alias_map.resolve_url(alias.url), (group.id, group.url))
+        eq_(alias_map.resolve_url(new_group.url),
+            (new_group.id, new_group.url))
+
+        with self.assertNumQueries(0):
+            alias_map.resolve_url(group.url)
+            alias_map.resolve_names(['cheese'])
+
+        # Renames and deletions do reload it.
+        alias.name = 'gouda'
+        alias.save()
+        eq_(alias_map.resolve_names(['cheese', 'gouda']),
+            {'gouda': group.id})
+        new_group.delete()
+        eq_(alias_map.resolve_url(new_group.url), None)
+
+    def test_set_membership(self):
+        """Test batched membership changes."""
+        profile = self.mozillian.get_profile()
+        profile.groups.add(self.SYSTEM_GROUP)
+        GroupAlias.objects.create(name='cheese', alias=self.NORMAL_GROUP)
+
+        profile.set_membership(Group, ['cheese', 'new group', 'new-group',
+                                       self.SYSTEM_GROUP.name])
+        names = sorted(profile.groups.values_list('name', flat=True))
+        eq_(names, ['cheesezilla', 'ghost', 'new group', 'new-group'])
+
+        for name in ['new group', 'new-group']:
+            group = Group.objects.get(name=name)
+            eq_(group.aliases.get().url, group.url)
+        self.assertNotEqual(Group.objects.get(name='new group').url,
+                            Group.objects.get(name='new-group').url)
+
+        profile.set_membership(Group, [])
+        eq_(list(profile.groups.all()), [self.SYSTEM_GROUP])
+
+    def test_member_count(self):
+        """Test that member counts follow membership changes."""
+        def count():
+            return Group.objects.get(pk=self.NORMAL_GROUP.pk).member_count
+
+        profile = self.mozillian.get_profile()
+        profile.groups.add(self.NORMAL_GROUP)
+        eq_(count(), 1)
+        self.NORMAL_GROUP.members.add(self.pending.get_profile())
+        eq_(count(), 2)
+        profile.groups.remove(self.NORMAL_GROUP)
+        eq_(count(), 1)
+        self.pending.get_profile().groups.clear()
+        eq_(count(), 0)
+
+        profile.groups.add(self.NORMAL_GROUP)
+        self.mozillian.delete()
+        eq_(count(), 0)
+
+        Group.objects.update(member_count=5)
+        Group.update_member_counts()
+        eq_(count(), 0)
+
+        # Saving a tag loaded before a membership change keeps the
+        # count.
+        group = Group.objects.get(pk=self.NORMAL_GROUP.pk)
+        self.mozillian2.get_profile().groups.add(group)
+        group.description = 'foo'
+        group.save()
+        eq_(count(), 1)
+
     def test_group_merging(self):
         """Test group merging."""
         master_group = self.NORMAL_GROUP
@@ -250,6 +353,22 @@ class GroupTest(apps.common.tests.init.ESTestCase):
         map(lambda x: eq_(x, master_group.id),
             GroupAlias.objects.values_list('alias', flat=True))
 
+    @patch('apps.users.tasks.index_profiles_task.delay')
+    def test_group_merging_members(self, index_mock):
+        """Test that merging moves memberships and reindexes members."""
+        master_group = self.NORMAL_GROUP
+        mozillian = self.mozillian.get_profile()
+        pending = self.pending.get_profile()
+        mozillian.groups.add(master_group, self.SYSTEM_GROUP)
+        pending.groups.add(self.SYSTEM_GROUP)
+
+        merge_groups(master_group, [self.SYSTEM_GROUP])
+        eq_(sorted(master_group.members.values_list('id', flat=True)),
+            sorted([mozillian.id, pending.id]))
+        eq_(Group.objects.get(pk=master_group.pk).member_count, 2)
+        eq_(sorted(index_mock.call_args[0][0]),
+            sorted([mozillian.id, pending.id]))
+
     def test_unique_url(self):
         """Test unique group url.
 
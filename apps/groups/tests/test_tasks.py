@@ -1,8 +1,9 @@
+from mock import patch
 from nose.tools import eq_
 
 from apps.common.tests.init import ESTestCase
 
-from apps.groups.models import Group, Skill
+from apps.groups.models import Group, GroupAlias, Language, Skill
 from apps.groups.tasks import remove_empty_groups
 
 class EmptyGroupsTest(ESTestCase):
@@ -10,9 +11,29 @@ class EmptyGroupsTest(ESTestCase):
 
     def test_empty_group_removal(self):
         """Test Empty Group Removal."""
-        for model in [Group, Skill]:
+        for model in [Group, Skill, Language]:
             model.objects.all().delete()
             model.objects.create(name='foo')
             eq_(model.objects.count(), 1)
             remove_empty_groups()
             eq_(model.objects.count(), 0)
+
+    @patch('apps.groups.tasks.invalidate_tag_model_caches')
+    @patch('apps.groups.utils.MAINTENANCE_CHUNK_SIZE', 2)
+    def test_chunked_removal(self, invalidate_mock):
+        """Test that only empty groups are removed, in chunks, and that
+        caches are invalidated once.
+
+        """
+        for model in [Group, Skill, Language]:
+            model.objects.all().delete()
+        for i in range(5):
+            Group.objects.create(name='empty %d' % i)
+        group = Group.objects.create(name='full')
+        self.mozillian.get_profile().groups.add(group)
+
+        remove_empty_groups()
+        eq_(list(Group.objects.all()), [group])
+        eq_(list(GroupAlias.objects.values_list('alias', flat=True)),
+            [group.id])
+        invalidate_mock.assert_called_once_with(Group)
@@ -1,7 +1,86 @@
+from django.conf import settings
+from django.db import connection, transaction
+
+from celeryutils import chunked
+
+from aliases import get_alias_map
+from autocomplete import get_prefix_index
+from models import Group
+
+# Rows updated or deleted per query by the maintenance jobs.
+MAINTENANCE_CHUNK_SIZE = getattr(settings, 'GROUPS_MAINTENANCE_CHUNK_SIZE',
+                                 1000)
+
+
 def merge_groups(master_group, group_list):
-    """Merge group_list into master_group."""
-    for group in group_list:
-        map(lambda x: master_group.members.add(x),
-            group.members.values_list('id', flat=True))
-        group.aliases.update(alias=master_group)
-        group.delete()
+    """Merge group_list into master_group.
+
+    Memberships are moved with a few set-based queries in a single
+    transaction, then the profiles whose documents list the merged
+    tags or the aliases of master_group are reindexed in bulk.
+
+    """
+    # Imported here, the users app depends on this one.
+    from apps.users.models import invalidate_privacy_levels, touch_profiles
+    from apps.users.tasks import index_profiles_task
+
+    model = type(master_group)
+    ids = [group.id for group in group_list if group.id != master_group.id]
+    if not ids:
+        return
+
+    field = model.members.related.field
+    through = field.rel.through
+    qn = connection.ops.quote_name
+    params = {'through': qn(through._meta.db_table),
+              'profile': qn(field.m2m_column_name()),
+              'tag': qn(field.m2m_reverse_name()),
+              'ids': ', '.join(['%s'] * len(ids))}
+
+    with transaction.commit_on_success():
+        profile_ids = list(
+            through.objects
+            .filter(**{'%s__in' % field.m2m_reverse_field_name():
+                       ids + [master_group.id]})
+            .values_list(field.m2m_field_name(), flat=True).distinct())
+
+        cursor = connection.cursor()
+        cursor.execute('INSERT IGNORE INTO %(through)s (%(profile)s, %(tag)s) '
+                       'SELECT %(profile)s, %%s FROM %(through)s '
+                       'WHERE %(tag)s IN (%(ids)s)' % params,
+                       [master_group.id] + ids)
+        cursor.execute('DELETE FROM %(through)s WHERE %(tag)s IN (%(ids)s)'
+                       % params, ids)
+        model.aliases.related.model.objects.filter(alias__in=ids).update(
+            alias=master_group)
+        model.objects.filter(id__in=ids).delete()
+        model.update_member_counts([master_group.id])
+        touch_profiles(profile_ids)
+
+    get_prefix_index(model).invalidate()
+    get_alias_map(model).invalidate()
+    names = [master_group.name] + [group.name for group in group_list]
+    if model is Group and 'staff' in names:
+        # Staff membership changed without m2m_changed.
+        invalidate_privacy_levels()
+    for chunk in chunked(profile_ids, MAINTENANCE_CHUNK_SIZE):
+        index_profiles_task.delay(chunk)
+
+
+def chunked_ids(queryset, chunk_size=None):
+    """Yield the ids of `queryset` in ascending lists of at most
+    `chunk_size` ids, MAINTENANCE_CHUNK_SIZE by default.
+
+    Every list is queried after the previous one was handled, so
+    callers can update or delete the rows they are given.
+
+    """
+    chunk_size = chunk_size or MAINTENANCE_CHUNK_SIZE
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by('id')
+                   .values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
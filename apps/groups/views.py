@@ -2,7 +2,7 @@ import json
 
 from django.core.paginator import EmptyPage, Paginator, PageNotAnInteger
 from django.db.models import Count
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.cache import cache_control, never_cache
 from django.views.decorators.http import require_POST
@@ -11,6 +11,8 @@ import commonware.log
 from funfactory.urlresolvers import reverse
 
 from apps.common.decorators import allow_unvouched
+from apps.groups.aliases import get_alias_map
+from apps.groups.autocomplete import get_prefix_index
 from apps.groups.models import Group, Skill
 from apps.phonebook import forms
 from apps.users.tasks import update_basket_task
@@ -39,22 +41,38 @@ def index(request):
 def search(request, searched_object=Group):
     """Simple wildcard search for a group using a GET parameter.
 
-    Used for group/skill/language auto-completion.
+    Used for group/skill/language auto-completion. Names are looked up
+    in the in-process prefix index of the model.
 
     """
     term = request.GET.get('term', None)
     if request.is_ajax() and term:
-        groups = searched_object.search(term).values_list('name', flat=True)
-        return HttpResponse(json.dumps(list(groups)),
+        groups = get_prefix_index(searched_object).search(term)
+        return HttpResponse(json.dumps(groups),
                             mimetype='application/json')
 
     return redirect('home')
 
 
+def _resolve_group_url(url):
+    """Return the id and url of the group with url or alias url `url`.
+
+    Raise Http404 if there's no such group.
+
+    """
+    group = get_alias_map(Group).resolve_url(url)
+    if group is None:
+        raise Http404
+    return group
+
+
 @never_cache
 def show(request, url):
     """List all vouched users with this group."""
-    group = get_object_or_404(Group, url=url)
+    group_id, group_url = _resolve_group_url(url)
+    if group_url != url:
+        return redirect(reverse('group', args=[group_url]))
+    group = get_object_or_404(Group, pk=group_id)
     limit = forms.PAGINATION_LIMIT
     in_group = (group.members.filter(user=request.user).exists())
     profiles = group.members.vouched()
@@ -100,7 +118,7 @@ def show(request, url):
 @require_POST
 def toggle(request, url):
     """Toggle the current user's membership of a group."""
-    group = get_object_or_404(Group, url=url)
+    group = get_object_or_404(Group, pk=_resolve_group_url(url)[0])
     profile = request.user.get_profile()
 
     # We don't operate on system groups using this view.
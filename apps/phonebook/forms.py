@@ -1,15 +1,19 @@
 import re
 
 from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
 from django.utils.safestring import mark_safe
 
 import happyforms
+from PIL import Image
 from product_details import product_details
 from tower import ugettext as _, ugettext_lazy as _lazy
 
 from apps.groups.models import Group, Skill, Language
 from apps.users.helpers import validate_username
-from apps.users.models import User, UserProfile
+from apps.users.models import (MAX_PHOTO_PIXELS, PHOTO_FORMATS, User,
+                               UserProfile)
 
 from models import Invite
 
@@ -84,7 +88,9 @@ class UserForm(happyforms.ModelForm):
 
 
 class BaseProfileForm(happyforms.ModelForm):
-    photo = forms.ImageField(label=_lazy(u'Profile Photo'), required=False)
+    # Photos are checked in clean_photo() without decoding them, see
+    # UserProfile.normalize_photo() for the rest.
+    photo = forms.FileField(label=_lazy(u'Profile Photo'), required=False)
     photo_delete = forms.BooleanField(label=_lazy(u'Remove Profile Photo'),
                                       required=False)
 
@@ -117,6 +123,35 @@ class BaseProfileForm(happyforms.ModelForm):
         country_list.insert(0, ('', '----'))
         self.fields['country'].choices = country_list
 
+    def clean_photo(self):
+        """Check the size, format and dimensions of an uploaded photo.
+
+        Only the image header is read, the photo is decoded later by
+        the task which normalizes it.
+
+        """
+        photo = self.cleaned_data['photo']
+        if not isinstance(photo, UploadedFile):
+            return photo
+
+        if photo.size > settings.MAX_PHOTO_UPLOAD_SIZE:
+            raise forms.ValidationError(_(u'The photo is too large.'))
+        try:
+            image = Image.open(photo)
+        except IOError:
+            raise forms.ValidationError(_(u'Upload a valid image. The file '
+                                           'you uploaded was either not an '
+                                           'image or a corrupted image.'))
+        if image.format not in PHOTO_FORMATS:
+            raise forms.ValidationError(_(u'Photos must be JPEG, PNG or GIF '
+                                           'images.'))
+        width, height = image.size
+        if width * height > MAX_PHOTO_PIXELS:
+            raise forms.ValidationError(_(u'The photo dimensions are too '
+                                           'large.'))
+        photo.seek(0)
+        return photo
+
     def clean_skills(self):
         if not re.match(r'^[a-zA-Z0-9 .:,-]*$', self.cleaned_data['skills']):
             raise forms.ValidationError(_(u'Skills can only contain '
@@ -18,3 +18,18 @@ def search_result(context, profile):
     d = dict(context.items())
     d.update(profile=profile)
     return d
+
+
+@register.inclusion_tag('phonebook/includes/search_results.html')
+@jinja2.contextfunction
+def search_results(context, profiles):
+    """Render the result cards of `profiles`.
+
+    Unlike search_result() in a loop, the context is copied once and
+    the card macro is imported once for the whole page, instead of
+    including the card template for every profile.
+
+    """
+    d = dict(context.items())
+    d.update(profiles=profiles)
+    return d
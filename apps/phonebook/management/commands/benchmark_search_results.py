@@ -0,0 +1,55 @@
+import time
+from itertools import cycle, islice
+from optparse import make_option
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.template.context import get_standard_processors
+from django.test.client import RequestFactory
+
+import jingo
+
+from apps.users.models import MOZILLIANS, UserProfile
+from apps.users.search import SearchResult
+
+ONE_BY_ONE = ('{% for profile in profiles %}'
+              '{{ search_result(profile) }}'
+              '{% endfor %}')
+BATCHED = '{{ search_results(profiles) }}'
+
+
+class Command(BaseCommand):
+    help = ('Compare the time it takes to render search result cards one '
+            'by one and in a batch.')
+    option_list = BaseCommand.option_list + (
+        make_option('--cards', type='int', default=100,
+                    help='Number of cards per page.'),
+        make_option('--repeat', type='int', default=50,
+                    help='Number of times each page is rendered.'))
+
+    def handle(self, *args, **options):
+        profiles = list(UserProfile.objects.exclude(full_name='')
+                        .select_related('user')[:options['cards']])
+        if not profiles:
+            raise CommandError('There are no complete profiles to render.')
+        # Cards are rendered from search documents, as on search pages.
+        results = [SearchResult(profile.id, profile.get_search_display(),
+                                MOZILLIANS) for profile in profiles]
+        results = list(islice(cycle(results), options['cards']))
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        context = {'request': request, 'profiles': results}
+        for processor in get_standard_processors():
+            context.update(processor(request))
+
+        for name, source in [('one by one', ONE_BY_ONE),
+                             ('batched', BATCHED)]:
+            template = jingo.env.from_string(source)
+            template.render(context)
+            start = time.time()
+            for i in range(options['repeat']):
+                template.render(context)
+            per_page = (time.time() - start) / options['repeat']
+            self.stdout.write('%s: %.2f ms per 100 cards\n'
+                              % (name, per_page * 100000 / len(results)))
@@ -1,3 +1,5 @@
+import json
+
 from funfactory.urlresolvers import reverse
 from nose.tools import eq_
 from pyquery import PyQuery as pq
@@ -23,9 +25,9 @@ class TestSearch(ESTestCase):
 
         eq_(response.status_code, 200)
 
-        queryset = response.context['people'].object_list
+        ids = [result.id for result in response.context['people']]
         for up in [self.mozillian.userprofile, self.mozillian2.userprofile]:
-            self.assertTrue(up in queryset)
+            self.assertTrue(up.id in ids)
 
         # Assert appropriate group names are found in the document
         self.assertContains(response, 'spam')
@@ -83,6 +85,23 @@ class TestSearch(ESTestCase):
         peeps = r.context['people']
         self.assertEqual(len(peeps), 2)
 
+    def test_search_people(self):
+        """Test the type-ahead people search."""
+        url = reverse('search_people')
+        r = self.mozillian_client.get(url, {'term': 'amand'})
+        eq_(r.status_code, 200)
+        profiles = json.loads(r.content)
+        eq_(sorted(profile['username'] for profile in profiles),
+            sorted([self.mozillian.username, self.mozillian2.username]))
+        eq_(set(profiles[0]), set(['id', 'name', 'username', 'photo']))
+
+        r = self.mozillian_client.get(url, {'term': 'amando br'})
+        eq_([profile['username'] for profile in json.loads(r.content)][:1],
+            [self.mozillian2.username])
+
+        r = self.mozillian_client.get(url)
+        eq_(json.loads(r.content), [])
+
     def test_empty_query_search(self):
         """Make sure the search method works with an empty query."""
         assert UserProfile.search('').count()
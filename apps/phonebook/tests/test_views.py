@@ -8,6 +8,7 @@ from funfactory.urlresolvers import set_url_prefix, reverse
 from nose.tools import eq_
 from pyquery import PyQuery as pq
 
+from apps.groups.models import Group
 from apps.users.models import MOZILLIANS
 from apps.common.tests.init import ESTestCase, user
 
@@ -197,6 +198,33 @@ class TestViews(ESTestCase):
         _get_page(self.incomplete_client, 200)
         _get_page(self.anonymous_client, 302)
 
+    def test_user_view_profile_changes(self):
+        """Test that cached profile cards follow profile changes."""
+        url = reverse('profile', args=[self.mozillian2.username])
+        profile = self.mozillian2.get_profile()
+        response = self.mozillian_client.get(url)
+        assert 'Cached Name' not in response.content
+
+        profile.full_name = 'Cached Name'
+        profile.save()
+        response = self.mozillian_client.get(url)
+        assert 'Cached Name' in response.content
+
+        profile.groups.add(Group.objects.create(name='cachezilla'))
+        response = self.mozillian_client.get(url)
+        eq_(pq(response.content)('#groups li').text(), 'cachezilla')
+
+    def test_user_view_profile_locales(self):
+        """Test that profile cards are cached per language."""
+        group = Group.objects.create(name='cachezilla')
+        self.mozillian2.get_profile().groups.add(group)
+        url = reverse('profile', args=[self.mozillian2.username])
+        for locale in ['en-US', 'fr', 'en-US']:
+            response = self.mozillian_client.get(
+                url.replace('/en-US/', '/%s/' % locale, 1))
+            eq_(pq(response.content)('#groups a').attr('href'),
+                '/%s/group/%s/' % (locale, group.url))
+
     def test_pending_edit_profile(self):
         # do all then reset
         newbie_client = self.pending_client
@@ -379,6 +407,19 @@ class TestViews(ESTestCase):
             new_photo = doc('#profile-photo').attr('src')
         assert new_photo != old_photo
 
+    def test_invalid_photo(self):
+        """Ensure files which aren't images are rejected."""
+        client = self.mozillian_client
+
+        with open(__file__.replace('.pyc', '.py'), 'rb') as f:
+            data = self.data_privacy_fields.copy()
+            data.update(dict(full_name='foo', country='pl', photo=f))
+            response = client.post(reverse('profile.edit'), data)
+
+        eq_(response.status_code, 400)
+        assert response.context['profile_form'].errors['photo']
+        assert not self.mozillian.get_profile().photo
+
 
 class TestVouch(ESTestCase):
     """This is implemented as its own class so that we can avoid
@@ -14,6 +14,7 @@ urlpatterns = patterns('',
     url('^delete/$', views.delete, name='profile.delete'),
     url('^opensearch.xml$', views.search_plugin, name='search_plugin'),
     url('^search/$', views.search, name='search'),
+    url('^search/people/$', views.search_people, name='search_people'),
     url('^vouch/$', views.vouch, name='vouch'),
     url('^invite/$', views.invite, name='invite'),
     url('^country/(?P<country>[A-Za-z]+)/$', views.list_mozillians_in_location,
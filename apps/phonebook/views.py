@@ -1,24 +1,37 @@
+import json
+from collections import namedtuple
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.http import Http404, HttpResponseForbidden
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.http import Http404, HttpResponse, HttpResponseForbidden
 from django.shortcuts import redirect, render
-from django.views.decorators.cache import cache_page, never_cache
+from django.views.decorators.cache import (cache_control, cache_page,
+                                           never_cache)
+from django.utils import translation
 from django.views.decorators.http import require_POST
 
 import commonware.log
 from funfactory.urlresolvers import reverse
+from jingo import render_to_string
+from jinja2 import Markup
 from tower import ugettext as _
 
+from apps.common.concurrency import submit
 from apps.common.decorators import allow_public, allow_unvouched
 from apps.common.middleware import LOGIN_MESSAGE, GET_VOUCHED_MESSAGE
 from apps.common.helpers import get_privacy_level
 from apps.groups.helpers import stringify_groups
 from apps.groups.models import Group
 from apps.users.models import (COUNTRIES, EMPLOYEES, MOZILLIANS,
-                               PUBLIC, PRIVILEGED, UserProfile)
+                               PUBLIC, PRIVILEGED, UserProfile,
+                               get_profile_version)
+from apps.users.search import (CachedProfileSearch, SearchPaginator,
+                               autocomplete_profiles)
 from apps.users.tasks import remove_from_basket_task
 
 
@@ -27,6 +40,13 @@ from models import Invite
 
 log = commonware.log.getLogger('m.phonebook')
 BAD_VOUCHER = 'Unknown Voucher'
+PROFILE_CARD_CACHE_KEY = 'phonebook:profile_card:%d:%d:%d:%d:%d:%s'
+PROFILE_CARD_CACHE_TIMEOUT = getattr(settings, 'PROFILE_CARD_CACHE_TIMEOUT',
+                                     600)
+
+# What profile.html needs besides the card, for cached profile cards.
+CachedProfile = namedtuple('CachedProfile', 'pk display_name is_vouched user')
+CachedProfileUser = namedtuple('CachedProfileUser', 'username')
 
 
 @never_cache
@@ -65,12 +85,12 @@ def view_profile(request, username):
                        .privacy_level(PRIVILEGED).get(user__username=username))
         data['privacy_mode'] = view_as
     else:
-        userprofile_query = UserProfile.objects.filter(user__username=username)
-        public_profile_exists = userprofile_query.public().exists()
-        profile_exists = userprofile_query.exists()
-        profile_complete = userprofile_query.exclude(full_name='').exists()
+        head = list(UserProfile.objects.filter(user__username=username)
+                    .values_list('id', 'is_public', 'full_name')[:1])
+        profile_id, is_public, full_name = (
+            head[0] if head else (None, False, ''))
 
-        if not public_profile_exists:
+        if not is_public:
             if not request.user.is_authenticated():
                 # you have to be authenticated to continue
                 messages.warning(request, LOGIN_MESSAGE)
@@ -80,12 +100,35 @@ def view_profile(request, username):
                 messages.error(request, GET_VOUCHED_MESSAGE)
                 return redirect('home')
 
-        if not profile_exists or not profile_complete:
+        if not profile_id or not full_name:
             raise Http404
 
-        profile = UserProfile.objects.get(user__username=username)
         privacy_level = get_privacy_level(request.user)
-        profile.set_instance_privacy_level(privacy_level)
+        # Cards have translated labels and localized links, and link
+        # groups for vouched viewers only.
+        viewer_is_vouched = (request.user.is_authenticated() and
+                             request.user.userprofile.is_vouched)
+        key = PROFILE_CARD_CACHE_KEY % (
+            profile_id, get_profile_version(profile_id), privacy_level,
+            request.user.is_authenticated(), viewer_is_vouched,
+            translation.get_language())
+        cached = cache.get(key)
+        if cached is None:
+            profile = (UserProfile.objects
+                       .select_related('user', 'vouched_by__user')
+                       .prefetch_related('groups', 'skills', 'languages')
+                       .get(pk=profile_id))
+            # Masked after prefetching, masked relations can't be.
+            profile.set_instance_privacy_level(privacy_level)
+            card = render_to_string(
+                request, 'phonebook/includes/profile_card.html',
+                {'profile': profile, 'shown_user': profile.user})
+            cached = (CachedProfile(profile.pk, profile.display_name,
+                                    profile.is_vouched,
+                                    CachedProfileUser(username)),
+                      card)
+            cache.set(key, cached, PROFILE_CARD_CACHE_TIMEOUT)
+        profile, data['profile_card'] = cached[0], Markup(cached[1])
 
         if (not profile.is_vouched
             and request.user.is_authenticated()
@@ -178,14 +221,15 @@ def search(request):
         limit = form.cleaned_data['limit']
         include_non_vouched = form.cleaned_data['include_non_vouched']
         page = request.GET.get('page', 1)
-        curated_groups = Group.get_curated()
 
+        # Look the groups up while ES searches for profiles.
+        curated_groups = submit(_get_curated_groups)
+        groups = submit(_search_groups, query)
 
-        profiles = UserProfile.search(
-            query, include_non_vouched=include_non_vouched)
-        groups = Group.search(query)
-
-        paginator = Paginator(profiles, limit)
+        profiles = CachedProfileSearch(
+            query, include_non_vouched=include_non_vouched,
+            privacy_level=get_privacy_level(request.user))
+        paginator = SearchPaginator(profiles, limit)
 
         try:
             people = paginator.page(page)
@@ -194,7 +238,10 @@ def search(request):
         except EmptyPage:
             people = paginator.page(paginator.num_pages)
 
-        if profiles.count() == 1 and not groups:
+        curated_groups = curated_groups.get()
+        groups = groups.get()
+
+        if paginator.count == 1 and not groups:
             return redirect(reverse('profile', args=[people[0].user.username]))
 
         if paginator.count > forms.PAGINATION_LIMIT:
@@ -215,6 +262,27 @@ def search(request):
     return render(request, 'phonebook/search.html', d)
 
 
+@cache_control(private=True, max_age=60)
+def search_people(request):
+    """Return the people whose name starts with the `term` GET parameter.
+
+    Used for type-ahead people search.
+
+    """
+    term = request.GET.get('term', u'')
+    profiles = autocomplete_profiles(
+        term, privacy_level=get_privacy_level(request.user))
+    return HttpResponse(json.dumps(profiles), mimetype='application/json')
+
+
+def _get_curated_groups():
+    return list(Group.get_curated())
+
+
+def _search_groups(query):
+    return list(Group.search(query))
+
+
 @allow_public
 @cache_page(60 * 60 * 168)  # 1 week.
 def search_plugin(request):
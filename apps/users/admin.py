@@ -9,7 +9,7 @@ from django.contrib.admin import SimpleListFilter
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group, User
 from django.core.urlresolvers import reverse
-from django.db.models import Count, Q
+from django.db.models import Count
 from django.http import HttpResponseRedirect
 from sorl.thumbnail.admin import AdminImageMixin
 
@@ -18,17 +18,11 @@ import autocomplete_light
 from apps.common.admin import export_as_csv_action
 
 import tasks
-from cron import index_all_profiles
-from models import COUNTRIES, PUBLIC, UserProfile, UsernameBlacklist
+from models import COUNTRIES, UserProfile, UsernameBlacklist
 
 admin.site.unregister(User)
 admin.site.unregister(Group)
 
-Q_PUBLIC_PROFILES = Q()
-for field in UserProfile._privacy_fields:
-    key = 'userprofile__privacy_%s' % field
-    Q_PUBLIC_PROFILES |= Q(**{key: PUBLIC})
-
 
 def _update_basket(action, request, queryset):
     """Generic basket (un)subscribe for queryset."""
@@ -89,10 +83,8 @@ class PublicProfileFilter(SimpleListFilter):
         if self.value() is None:
             return queryset
 
-        if self.value() == 'True':
-            return queryset.filter(Q_PUBLIC_PROFILES)
-
-        return queryset.exclude(Q_PUBLIC_PROFILES)
+        value = self.value() == 'True'
+        return queryset.filter(userprofile__is_public=value)
 
 class CompleteProfileFilter(SimpleListFilter):
     """Admin filter for complete profiles."""
@@ -204,7 +196,7 @@ class UserAdmin(UserAdmin):
 
     def index_profiles(self, request):
         """Fire an Elastic Search Index Profiles task."""
-        index_all_profiles()
+        tasks.index_all_profiles_task.delay()
         messages.success(request, 'Profile indexing started.')
         return HttpResponseRedirect(reverse('admin:auth_user_changelist'))
 
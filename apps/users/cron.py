@@ -1,35 +1,260 @@
+import re
+import time
+from datetime import datetime, timedelta
+
 import commonware.log
 import cronjobs
 import pyes.exceptions
-
-from celery.task.sets import TaskSet
 from celeryutils import chunked
+
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django_statsd.clients import statsd
 
-from elasticutils.contrib.django import get_es, tasks
-from models import UserProfile
+from elasticutils.contrib.django import get_es
+from indexing import (MISSING, ORPHANED, REINDEX_STATE_KEY, STALE,
+                      compare_index, get_reindex_state, index_profiles,
+                      unindex_profiles)
+from models import IndexWatermark, UserProfile
+from search import invalidate_search_cache
+from tasks import generate_photo_thumbnails_task
+
+REINDEX_CHUNK_SIZE = getattr(settings, 'ES_REINDEX_CHUNK_SIZE', 500)
+# Live writes also go to the index of the checkpoint, so an abandoned
+# run stops being resumable once its checkpoint hasn't been refreshed
+# for this long.
+REINDEX_STATE_TIMEOUT = getattr(settings, 'ES_REINDEX_STATE_TIMEOUT', 3600)
+REINDEX_LOCK_KEY = 'users:reindex:lock'
+REINDEX_LOCK_TIMEOUT = getattr(settings, 'ES_REINDEX_LOCK_TIMEOUT', 600)
+REINDEX_NAME_FORMAT = '%Y%m%d%H%M%S'
+# Profiles per thumbnail generation task.
+THUMBNAIL_CHUNK_SIZE = 100
+INDEX_REPLICAS = getattr(settings, 'ES_INDEX_REPLICAS', 1)
+# Profiles updated in the last seconds may belong to transactions that
+# have not committed yet; leave them for the next run.
+INDEX_SYNC_LAG = getattr(settings, 'ES_INDEX_SYNC_LAG', 60)
 
 log = commonware.log.getLogger('m.cron')
 
 
+def _index_exists(es, index):
+    return index in es.get_indices()
+
+
+def _alias_targets(es, alias):
+    """Return the indexes alias `alias` points to."""
+    try:
+        return es.get_alias(alias)
+    except pyes.exceptions.IndexMissingException:
+        return []
+
+
+def _is_versioned_index(name, alias):
+    """Return whether index `name` was built by index_all_profiles()
+    for alias `alias`.
+
+    """
+    match = re.match(r'^%s_(\d{14})$' % re.escape(alias), name)
+    if not match:
+        return False
+    try:
+        datetime.strptime(match.group(1), REINDEX_NAME_FORMAT)
+    except ValueError:
+        return False
+    return True
+
+
 @cronjobs.register
 def index_all_profiles():
-    # Get an es object, delete index and re-create it
+    """Rebuild the profile index without taking search down.
 
-    index = settings.ES_INDEXES['default']
-    es = get_es(timeout=settings.ES_INDEXING_TIMEOUT)
+    Profiles are indexed into a new versioned index while the alias
+    named after ES_INDEXES['default'] keeps serving the old one. Once
+    the new index is complete the alias is atomically moved to it and
+    the versioned indexes of older runs are deleted.
+
+    Profiles are walked in id order and the last indexed id is
+    checkpointed in the cache, so that a failed run resumes where it
+    stopped instead of starting over. Only one rebuild runs at a time.
+
+    """
+    if not cache.add(REINDEX_LOCK_KEY, True, REINDEX_LOCK_TIMEOUT):
+        log.info('Another rebuild of the profile index is running.')
+        return
     try:
-        es.delete_index_if_exists(index)
-    except pyes.exceptions.IndexMissingException:
-        pass
+        _index_all_profiles()
+    finally:
+        cache.delete(REINDEX_LOCK_KEY)
+
+
+def _index_all_profiles():
+    alias = settings.ES_INDEXES['default']
+    es = get_es(timeout=settings.ES_INDEXING_TIMEOUT)
+
+    state = get_reindex_state()
+    if state and _index_exists(es, state['index']):
+        index, last_id = state['index'], state['last_id']
+        log.info('Resuming indexing into %s after profile %d.'
+                 % (index, last_id))
+    else:
+        if state:
+            # The index of the abandoned run is gone; stop sending live
+            # writes to it.
+            cache.delete(REINDEX_STATE_KEY)
+        index = '%s_%s' % (alias,
+                           datetime.now().strftime(REINDEX_NAME_FORMAT))
+        last_id = 0
+        # Refreshing and replicating while bulk loading only slows
+        # the build down; both are restored before the swap.
+        es.create_index(index, settings={
+            'settings': {'refresh_interval': '-1',
+                         'number_of_replicas': 0,
+                         'analysis': UserProfile.get_analysis()},
+            'mappings': {UserProfile._meta.db_table:
+                         UserProfile.get_mapping()}})
+        cache.set(REINDEX_STATE_KEY, {'index': index, 'last_id': last_id},
+                  REINDEX_STATE_TIMEOUT)
+        log.info('Indexing profiles into %s.' % index)
 
-    mappings = {'mappings':
-                {UserProfile._meta.db_table: UserProfile.get_mapping()}}
+    start = time.time()
+    count = 0
+    profiles = UserProfile.objects.exclude(full_name='').order_by('id')
+    while True:
+        ids = list(profiles.filter(id__gt=last_id)
+                   .values_list('id', flat=True)[:REINDEX_CHUNK_SIZE])
+        if not ids:
+            break
+        with statsd.timer('users.reindex.chunk'):
+            index_profiles(ids, index=index)
+        last_id = ids[-1]
+        count += len(ids)
+        cache.set(REINDEX_STATE_KEY, {'index': index, 'last_id': last_id},
+                  REINDEX_STATE_TIMEOUT)
+        cache.set(REINDEX_LOCK_KEY, True, REINDEX_LOCK_TIMEOUT)
+        statsd.incr('users.reindex.profiles', len(ids))
+
+    es.update_settings(index, {'index': {
+        'refresh_interval': '1s', 'number_of_replicas': INDEX_REPLICAS}})
+    es.refresh(index)
+
+    old_indexes = _alias_targets(es, alias)
+    if _index_exists(es, alias):
+        # Indexes built before aliases were introduced use the alias
+        # name; it has to go before the alias can be created.
+        es.delete_index(alias)
+    es.change_aliases([('remove', old, alias) for old in old_indexes] +
+                      [('add', index, alias)])
+    cache.delete(REINDEX_STATE_KEY)
+    invalidate_search_cache()
+
+    # Drop the indexes the alias served and those left behind by
+    # abandoned runs. Other indexes sharing the alias prefix are not
+    # ours to delete.
+    for old in es.get_indices():
+        if old != index and (old in old_indexes or
+                             _is_versioned_index(old, alias)):
+            es.delete_index(old)
+
+    duration = time.time() - start
+    statsd.timing('users.reindex.duration', int(duration * 1000))
+    if duration:
+        statsd.gauge('users.reindex.throughput', int(count / duration))
+    log.info('Indexed %d profiles into %s in %.1fs.'
+             % (count, index, duration))
+
+
+@cronjobs.register
+def index_updated_profiles():
+    """Index profiles updated since the last run.
+
+    Profiles are walked in (last_updated, id) order from the 'profiles'
+    watermark, which is advanced after every indexed chunk. Running
+    this every few minutes repairs the index after missed indexing
+    tasks. The first run only records the starting point.
+
+    """
+    watermark, created = IndexWatermark.objects.get_or_create(
+        name='profiles', defaults={'last_updated': datetime.now()})
+    if created:
+        log.info('Created the profile index watermark.')
+        return
+
+    until = datetime.now() - timedelta(seconds=INDEX_SYNC_LAG)
+    profiles = (UserProfile.objects.exclude(full_name='')
+                .filter(last_updated__lte=until)
+                .order_by('last_updated', 'id'))
+    count = 0
+    while True:
+        chunk = list(profiles.filter(
+            Q(last_updated__gt=watermark.last_updated) |
+            Q(last_updated=watermark.last_updated, id__gt=watermark.last_id))
+            .values_list('id', 'last_updated')[:REINDEX_CHUNK_SIZE])
+        if not chunk:
+            break
+        index_profiles([profile_id for profile_id, updated in chunk])
+        watermark.last_id, watermark.last_updated = chunk[-1]
+        with transaction.commit_on_success():
+            watermark.save()
+        count += len(chunk)
+
+    statsd.incr('users.index_sync.profiles', count)
+    log.info('Indexed %d updated profiles.' % count)
+
+
+@cronjobs.register
+def check_profile_index(repair=False):
+    """Report profiles missing, stale or orphaned in the index.
+
+    Run as `./manage.py cron check_profile_index repair` to also
+    reindex or unindex the drifted profiles, in bulk chunks.
+
+    """
+    counts = {MISSING: 0, STALE: 0, ORPHANED: 0}
+    to_index = []
+    to_unindex = []
+    for kind, profile_id in compare_index():
+        counts[kind] += 1
+        log.debug('Profile %d is %s.' % (profile_id, kind))
+        if not repair:
+            continue
+        if kind == ORPHANED:
+            to_unindex.append(profile_id)
+        else:
+            to_index.append(profile_id)
+        if len(to_index) >= REINDEX_CHUNK_SIZE:
+            index_profiles(to_index)
+            to_index = []
+        if len(to_unindex) >= REINDEX_CHUNK_SIZE:
+            unindex_profiles(to_unindex)
+            to_unindex = []
+
+    if to_index:
+        index_profiles(to_index)
+    if to_unindex:
+        unindex_profiles(to_unindex)
+
+    for kind, count in counts.iteritems():
+        statsd.gauge('users.index_check.%s' % kind, count)
+    log.info('Profiles missing: %d, stale: %d, orphaned: %d%s.'
+             % (counts[MISSING], counts[STALE], counts[ORPHANED],
+                ' (repaired)' if repair else ''))
+
+
+@cronjobs.register
+def generate_photo_thumbnails(regenerate=False):
+    """Queue thumbnail generation for the profile photos lacking them.
 
-    es.create_index(index, settings=mappings)
+    Run as `./manage.py cron generate_photo_thumbnails regenerate` to
+    regenerate the thumbnails of all photos, e.g. after changing
+    PHOTO_THUMBNAIL_GEOMETRIES.
 
-    ids = (UserProfile.objects.exclude(full_name='')
-           .values_list('id', flat=True))
-    ts = [tasks.index_objects.subtask(args=[UserProfile, chunk])
-          for chunk in chunked(sorted(list(ids)), 150)]
-    TaskSet(ts).apply_async()
+    """
+    profiles = UserProfile.objects.exclude(photo='')
+    if not regenerate:
+        profiles = profiles.filter(photo_thumbnails='')
+    ids = list(profiles.values_list('id', flat=True))
+    for chunk in chunked(ids, THUMBNAIL_CHUNK_SIZE):
+        generate_photo_thumbnails_task.delay(chunk)
+    log.info('Queued thumbnail generation for %d profiles.' % len(ids))
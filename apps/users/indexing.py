@@ -0,0 +1,229 @@
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+
+import commonware.log
+import pyes.exceptions
+from celery.signals import task_postrun
+from celeryutils import chunked
+from django_statsd.clients import statsd
+from elasticutils.contrib.django import S, get_es
+
+from tasks import index_profiles_task, unindex_profiles_task
+
+INDEX_BUFFER_SIZE = getattr(settings, 'ES_INDEX_BUFFER_SIZE', 100)
+INDEX_BUFFER_MAX_AGE = getattr(settings, 'ES_INDEX_BUFFER_MAX_AGE', 5)
+REINDEX_STATE_KEY = 'users:reindex'
+CHECK_PAGE_SIZE = getattr(settings, 'ES_CHECK_PAGE_SIZE', 1000)
+# last_updated is compared to the second, as stored by MySQL.
+STAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+MISSING = 'missing'
+STALE = 'stale'
+ORPHANED = 'orphaned'
+
+log = commonware.log.getLogger('m.users')
+
+
+class IndexBuffer(object):
+    """Collect ids of profiles to (un)index and send them to ES in bulk.
+
+    Ids are deduplicated and flushed in batches of at most `size` ids
+    when the buffer fills up, when its oldest id has waited more than
+    `max_age` seconds, at the end of every request and Celery task and
+    at process exit.
+
+    """
+
+    def __init__(self, size=INDEX_BUFFER_SIZE, max_age=INDEX_BUFFER_MAX_AGE):
+        self.size = size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._to_index = set()
+        self._to_unindex = set()
+        self._since = None
+
+    def index(self, profile_id):
+        """Schedule profile `profile_id` for indexing."""
+        self._add(profile_id, self._to_index, self._to_unindex)
+
+    def unindex(self, profile_id):
+        """Schedule profile `profile_id` for removal from the index."""
+        self._add(profile_id, self._to_unindex, self._to_index)
+
+    def _add(self, profile_id, add_to, discard_from):
+        with self._lock:
+            discard_from.discard(profile_id)
+            add_to.add(profile_id)
+            if self._since is None:
+                self._since = time.time()
+            full = (len(self._to_index) + len(self._to_unindex) >= self.size
+                    or time.time() - self._since >= self.max_age)
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Send all buffered ids to ES."""
+        with self._lock:
+            to_index, to_unindex = self._to_index, self._to_unindex
+            since = self._since
+            self._reset()
+
+        if not to_index and not to_unindex:
+            return
+
+        with statsd.timer('users.index_buffer.flush'):
+            for chunk in chunked(sorted(to_index), self.size):
+                index_profiles_task.delay(chunk)
+            for chunk in chunked(sorted(to_unindex), self.size):
+                unindex_profiles_task.delay(chunk)
+
+        statsd.timing('users.index_buffer.latency',
+                      int((time.time() - since) * 1000))
+        statsd.gauge('users.index_buffer.batch_size',
+                     len(to_index) + len(to_unindex))
+        log.debug('Flushed %d profiles to index and %d to unindex.'
+                  % (len(to_index), len(to_unindex)))
+
+
+def get_reindex_state():
+    """Return the checkpoint of the running full reindex, if any.
+
+    The checkpoint is a dict with the name of the index being built
+    and the id of the last profile sent to it.
+
+    """
+    return cache.get(REINDEX_STATE_KEY)
+
+
+def _target_indexes(index=None):
+    """Return the indexes to write to.
+
+    Unless `index` is given, updates go to the live index and to the
+    index being built by a running full reindex, so that the new index
+    does not miss changes to profiles it has already been sent.
+
+    """
+    if index:
+        return [index]
+    indexes = [settings.ES_INDEXES['default']]
+    state = get_reindex_state()
+    if state:
+        indexes.append(state['index'])
+    return indexes
+
+
+def index_profiles(ids, index=None):
+    """Index profiles `ids` with one bulk request per index."""
+    from models import UserProfile
+    from search import invalidate_search_cache
+    doc_type = UserProfile._meta.db_table
+    documents = UserProfile.extract_documents(ids)
+    es = get_es(timeout=settings.ES_INDEXING_TIMEOUT)
+    for target in _target_indexes(index):
+        for document in documents:
+            es.index(document, target, doc_type, id=document['id'],
+                     bulk=True)
+        es.flush_bulk(forced=True)
+    invalidate_search_cache()
+
+
+def unindex_profiles(ids, index=None):
+    """Remove profiles `ids` with one bulk request per index."""
+    from models import UserProfile
+    from search import invalidate_search_cache
+    doc_type = UserProfile._meta.db_table
+    es = get_es(timeout=settings.ES_INDEXING_TIMEOUT)
+    for target in _target_indexes(index):
+        try:
+            for profile_id in ids:
+                es.delete(target, doc_type, profile_id, bulk=True)
+            es.flush_bulk(forced=True)
+        except pyes.exceptions.ElasticSearchException, e:
+            # Patch pyes
+            if (e.status == 404 and
+                isinstance(e.result, dict) and 'error' not in e.result):
+                # Item was not found, but command did not return an error.
+                # Do not worry.
+                continue
+            else:
+                raise e
+    invalidate_search_cache()
+
+
+def _db_stamps(page_size):
+    """Yield (id, last_updated) of the complete profiles in id order."""
+    from models import UserProfile
+    profiles = UserProfile.objects.exclude(full_name='').order_by('id')
+    last_id = 0
+    while True:
+        page = list(profiles.filter(id__gt=last_id)
+                    .values_list('id', 'last_updated')[:page_size])
+        if not page:
+            return
+        for profile_id, last_updated in page:
+            yield profile_id, last_updated.strftime(STAMP_FORMAT)
+        last_id = page[-1][0]
+
+
+def _index_stamps(page_size):
+    """Yield (id, last_updated) of the indexed profiles in id order."""
+    from models import UserProfile
+    documents = S(UserProfile).order_by('id')
+    last_id = 0
+    while True:
+        page = list(documents.filter(id__gt=last_id)
+                    .values_list('id', 'last_updated')[:page_size])
+        if not page:
+            return
+        for profile_id, last_updated in page:
+            # Documents indexed before last_updated was added have none.
+            yield int(profile_id), (last_updated or '')[:19]
+        last_id = int(page[-1][0])
+
+
+def compare_index(page_size=CHECK_PAGE_SIZE):
+    """Compare the profile table with the index.
+
+    Both sides are streamed in id order, `page_size` rows at a time,
+    and merged, so memory use doesn't grow with the number of profiles.
+    Yields (kind, id) for every profile that is MISSING from the index,
+    STALE in the index or ORPHANED in the index.
+
+    """
+    db_rows = _db_stamps(page_size)
+    index_rows = _index_stamps(page_size)
+    db_row = next(db_rows, None)
+    index_row = next(index_rows, None)
+    while db_row or index_row:
+        if index_row is None or (db_row and db_row[0] < index_row[0]):
+            yield MISSING, db_row[0]
+            db_row = next(db_rows, None)
+        elif db_row is None or index_row[0] < db_row[0]:
+            yield ORPHANED, index_row[0]
+            index_row = next(index_rows, None)
+        else:
+            if db_row[1] != index_row[1]:
+                yield STALE, db_row[0]
+            db_row = next(db_rows, None)
+            index_row = next(index_rows, None)
+
+
+index_buffer = IndexBuffer()
+
+
+def flush_index_buffer(**kwargs):
+    index_buffer.flush()
+
+request_finished.connect(flush_index_buffer,
+                         dispatch_uid='flush_index_buffer_request_sig')
+task_postrun.connect(flush_index_buffer,
+                     dispatch_uid='flush_index_buffer_task_sig')
+atexit.register(flush_index_buffer)
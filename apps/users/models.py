@@ -1,38 +1,84 @@
+import json
 import os
 import uuid
+from collections import defaultdict
+from cStringIO import StringIO
 from datetime import datetime
 
-import pyes
-
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
 from django.core.mail import send_mail
 from django.db import models
-from django.db.models import Q
 from django.db.models import signals as dbsignals
+from django.db.models.fields.files import FieldFile
 from django.db.models.query import QuerySet, ValuesQuerySet
 from django.dispatch import receiver
 
 from elasticutils.contrib.django import S
 from elasticutils.contrib.django.models import SearchMixin
-from elasticutils.contrib.django import tasks as elasticutilstasks
 from funfactory.urlresolvers import reverse
+from PIL import Image
 from product_details import product_details
-from sorl.thumbnail import ImageField, get_thumbnail
+from sorl.thumbnail import ImageField, delete, get_thumbnail
 from tower import ugettext as _, ugettext_lazy as _lazy
 
+from apps.common.cache import bump_generation, get_generation
 from apps.common.helpers import gravatar
+from apps.groups.aliases import get_alias_map
 from apps.groups.models import (Group, GroupAlias,
                                 Skill, SkillAlias,
                                 Language, LanguageAlias)
 
 
-from tasks import update_basket_task
+from indexing import index_buffer
+from tasks import process_photo_task, update_basket_task
 
 COUNTRIES = product_details.get_regions('en-US')
 
 USERNAME_MAX_LENGTH = 30
 AVATAR_SIZE = (300, 300)
+# Formats of the photos accepted on upload and the largest number of
+# pixels they may have, checked without decoding them.
+PHOTO_FORMATS = ('JPEG', 'PNG', 'GIF')
+MAX_PHOTO_PIXELS = getattr(settings, 'MAX_PHOTO_PIXELS', 25 * 1000 * 1000)
+PHOTO_JPEG_QUALITY = 90
+EXIF_ORIENTATION_TAG = 0x0112
+# Transpositions which turn photos upright, by EXIF orientation.
+EXIF_ORIENTATION_TRANSPOSES = {
+    2: [Image.FLIP_LEFT_RIGHT],
+    3: [Image.ROTATE_180],
+    4: [Image.FLIP_TOP_BOTTOM],
+    5: [Image.ROTATE_90, Image.FLIP_TOP_BOTTOM],
+    6: [Image.ROTATE_270],
+    7: [Image.ROTATE_270, Image.FLIP_TOP_BOTTOM],
+    8: [Image.ROTATE_90]}
+PRIVACY_LEVEL_GENERATION = 'users:privacy_level'
+PRIVACY_LEVEL_CACHE_KEY = 'users:privacy_level:%d:%d:%d'
+PRIVACY_LEVEL_CACHE_TIMEOUT = getattr(settings, 'PRIVACY_LEVEL_CACHE_TIMEOUT',
+                                      60 * 60)
+PROFILE_VERSION_GENERATION = 'users:profile:%d'
+
+# Fields each post_save consumer of UserProfile depends on. 'user'
+# stands for changes of the USER_MIRRORED_FIELDS of the related User.
+USER_MIRRORED_FIELDS = ('username', 'email')
+SEARCH_INDEX_FIELDS = frozenset([
+    'full_name', 'is_vouched', 'website', 'ircname', 'bio', 'photo',
+    'country', 'region', 'city', 'allows_mozilla_sites',
+    'allows_community_sites', 'groups', 'skills', 'languages', 'user',
+    'privacy_full_name', 'privacy_email', 'privacy_photo'])
+BASKET_FIELDS = frozenset(['is_vouched', 'country', 'city', 'groups', 'user'])
+PHOTO_FIELDS = frozenset(['photo'])
+STAFF_GROUP_FIELDS = frozenset(['groups', 'user'])
+
+# Search result cards show photos of this size.
+SEARCH_RESULT_PHOTO_GEOMETRY = '70x70'
+# Thumbnails generated when photos are uploaded, see
+# UserProfile.generate_photo_thumbnails().
+PHOTO_THUMBNAIL_GEOMETRIES = getattr(
+    settings, 'PHOTO_THUMBNAIL_GEOMETRIES',
+    ['160x160', SEARCH_RESULT_PHOTO_GEOMETRY])
 
 PRIVILEGED = 1
 EMPLOYEES = 2
@@ -44,6 +90,35 @@ PRIVACY_CHOICES = (# (PRIVILEGED, 'Privileged'),
                    (PUBLIC, 'Public'))
 
 
+# Urls of the default photo thumbnails, by geometry.
+_default_photo_urls = {}
+
+
+def get_default_photo_url(geometry):
+    """Return the url of the default photo thumbnail of `geometry`.
+
+    Urls are resolved through the thumbnail store once per process.
+
+    """
+    url = _default_photo_urls.get(geometry)
+    if url is None:
+        url = get_thumbnail(settings.DEFAULT_AVATAR_PATH, geometry,
+                            crop='center').url
+        _default_photo_urls[geometry] = url
+    return url
+
+
+def _get_exif_orientation(image):
+    """Return the EXIF orientation of `image`, 1 if it has none."""
+    try:
+        exif = image._getexif() or {}
+    except Exception:
+        # Only JPEGs have _getexif() and PIL raises all sorts of
+        # errors on broken EXIF data.
+        return 1
+    return exif.get(EXIF_ORIENTATION_TAG, 1)
+
+
 def _calculate_photo_filename(instance, filename):
     """Generate a unique filename for uploaded photo."""
     return os.path.join(settings.USER_AVATAR_DIR, str(uuid.uuid4()) + '.jpg')
@@ -72,28 +147,26 @@ class UserProfileValuesQuerySet(ValuesQuerySet):
 
         names = extra_names + field_names + aggregate_names
 
-        privacy_fields = [
-            (names.index('privacy_%s' % field), names.index(field), field)
-            for field in set(UserProfile._privacy_fields) & set(names)]
+        privacy_level = getattr(self, '_privacy_level', None)
+        privacy_fields = []
+        if privacy_level is not None:
+            privacy_fields = [
+                (names.index('privacy_%s' % field), names.index(field),
+                 UserProfile._privacy_fields[field])
+                for field in set(UserProfile._privacy_fields) & set(names)]
 
         for row in self.query.get_compiler(self.db).results_iter():
-            row = list(row)
-            for levelindex, fieldindex, field in privacy_fields:
-                if row[levelindex] < self._privacy_level:
-                    row[fieldindex] = UserProfile._privacy_fields[field]
+            if privacy_fields:
+                row = list(row)
+                for levelindex, fieldindex, masked_value in privacy_fields:
+                    if row[levelindex] < privacy_level:
+                        row[fieldindex] = masked_value
             yield dict(zip(names, row))
 
 
 class UserProfileQuerySet(QuerySet):
     """Custom QuerySet to support privacy."""
 
-    def __init__(self, *args, **kwargs):
-        self.public_q = Q()
-        for field in UserProfile._privacy_fields:
-            key = 'privacy_%s' % field
-            self.public_q |= Q(**{key: PUBLIC})
-        return super(UserProfileQuerySet, self).__init__(*args, **kwargs)
-
     def privacy_level(self, level=MOZILLIANS):
         """Set privacy level for query set."""
         self._privacy_level = level
@@ -101,7 +174,7 @@ class UserProfileQuerySet(QuerySet):
 
     def public(self):
         """Return profiles with at least one PUBLIC field."""
-        return self.filter(self.public_q)
+        return self.filter(is_public=True)
 
     def vouched(self):
         """Return complete and vouched profiles."""
@@ -120,14 +193,11 @@ class UserProfileQuerySet(QuerySet):
         object returned.
 
         """
-
-        def _generator():
-            self._iterator = super(UserProfileQuerySet, self).iterator()
-            while True:
-                obj = self._iterator.next()
-                obj._privacy_level = getattr(self, '_privacy_level', None)
-                yield obj
-        return _generator()
+        privacy_level = getattr(self, '_privacy_level', None)
+        for obj in super(UserProfileQuerySet, self).iterator():
+            if privacy_level is not None:
+                obj.set_instance_privacy_level(privacy_level)
+            yield obj
 
 
 class UserProfileManager(models.Manager):
@@ -142,6 +212,54 @@ class UserProfileManager(models.Manager):
         return getattr(self.get_query_set(), name)
 
 
+class PrivacyMaskDescriptor(object):
+    """Descriptor guarding a privacy protected attribute.
+
+    Returns the masked value of the attribute when the instance's
+    privacy mask contains it, otherwise delegates to the descriptor
+    it replaced or reads the value from the instance dict.
+
+    """
+
+    def __init__(self, name, descriptor=None):
+        self.name = name
+        self.descriptor = descriptor
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            if self.descriptor is None:
+                raise AttributeError(self.name)
+            return self.descriptor.__get__(None, owner)
+
+        mask = instance._privacy_mask
+        if self.name in mask:
+            return mask[self.name]
+
+        if self.descriptor is not None:
+            return self.descriptor.__get__(instance, owner)
+        try:
+            return instance.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+
+    def __set__(self, instance, value):
+        if self.descriptor is not None:
+            self.descriptor.__set__(instance, value)
+        else:
+            instance.__dict__[self.name] = value
+
+
+def _install_privacy_descriptors(cls):
+    """Guard all privacy protected attributes of `cls`."""
+    for name in cls._privacy_fields:
+        descriptor = None
+        for klass in cls.__mro__:
+            if name in klass.__dict__:
+                descriptor = klass.__dict__[name]
+                break
+        setattr(cls, name, PrivacyMaskDescriptor(name, descriptor))
+
+
 class UserProfilePrivacyModel(models.Model):
     _privacy_fields = {'photo': None,
                        'full_name': '',
@@ -156,7 +274,12 @@ class UserProfilePrivacyModel(models.Model):
                        'skills': Skill.objects.none(),
                        'languages': Language.objects.none(),
                        'vouched_by': None}
+    _privacy_fields_order = sorted(_privacy_fields)
     _privacy_level = None
+    _privacy_mask = {}
+    # Compiled privacy masks, keyed by privacy level and the values
+    # of the privacy_* fields in _privacy_fields_order.
+    _privacy_masks = {}
 
     privacy_photo = models.PositiveIntegerField(default=MOZILLIANS,
                                                 choices=PRIVACY_CHOICES)
@@ -188,15 +311,48 @@ class UserProfilePrivacyModel(models.Model):
     class Meta:
         abstract=True
 
+    def __setattr__(self, name, value):
+        super(UserProfilePrivacyModel, self).__setattr__(name, value)
+        # Keep the mask in line with changed privacy settings.
+        if name.startswith('privacy_') and self._privacy_level is not None:
+            self._privacy_mask = self._get_privacy_mask(self._privacy_level)
+
+    def _get_privacy_mask(self, level):
+        """Return the dict of masked values for viewers of `level`.
+
+        Masks only depend on the level and the privacy settings of the
+        instance, so they are compiled once and shared between
+        instances with the same settings.
+
+        """
+        if level is None:
+            return {}
+
+        # getattr() loads deferred privacy fields.
+        key = (level,) + tuple(getattr(self, 'privacy_%s' % field)
+                               for field in self._privacy_fields_order)
+        mask = self._privacy_masks.get(key)
+        if mask is None:
+            mask = dict((field, self._privacy_fields[field])
+                        for field, privacy in
+                        zip(self._privacy_fields_order, key[1:])
+                        if privacy < level)
+            self._privacy_masks[key] = mask
+        return mask
+
 
 class UserProfile(UserProfilePrivacyModel, SearchMixin):
     objects = UserProfileManager()
+    _level = None
+    _initial_state = {}
+    _changed_relations = frozenset()
 
     user = models.OneToOneField(User)
     full_name = models.CharField(max_length=255, default='', blank=False,
                                  verbose_name=_lazy(u'Full Name'))
     is_vouched = models.BooleanField(default=False)
-    last_updated = models.DateTimeField(auto_now=True, default=datetime.now)
+    last_updated = models.DateTimeField(auto_now=True, default=datetime.now,
+                                        db_index=True)
     website = models.URLField(max_length=200, verbose_name=_lazy(u'Website'),
                               default='', blank=True)
     vouched_by = models.ForeignKey('UserProfile', null=True, default=None,
@@ -210,6 +366,10 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
     bio = models.TextField(verbose_name=_lazy(u'Bio'), default='', blank=True)
     photo = ImageField(default='', blank=True,
                        upload_to=_calculate_photo_filename)
+    # JSON of the name of the photo and of its thumbnail urls by
+    # geometry, see generate_photo_thumbnails().
+    photo_thumbnails = models.TextField(default='', blank=True,
+                                        editable=False)
     ircname = models.CharField(max_length=63,
                                verbose_name=_lazy(u'IRC Nickname'),
                                default='', blank=True)
@@ -230,61 +390,96 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
         verbose_name=_lazy(u'Allow Mozilla sites to access my profile data?'),
         choices=((True, _lazy(u'Yes')), (False, _lazy(u'No'))))
     basket_token = models.CharField(max_length=1024, default='', blank=True)
+    # Denormalized from the privacy fields to allow indexed lookups of
+    # public profiles. Kept in sync by save() and set_privacy_level().
+    is_public = models.BooleanField(default=False, db_index=True,
+                                    editable=False)
 
     class Meta:
         db_table = 'profile'
         ordering = ['full_name']
 
-    def __getattribute__(self, attrname):
-        _getattr = (lambda x:
-                    super(UserProfile, self).__getattribute__(x))
-        privacy_fields = _getattr('_privacy_fields')
-        privacy_level = _getattr('_privacy_level')
-        if privacy_level is not None and attrname in privacy_fields:
-            field_privacy = _getattr('privacy_%s' % attrname)
-            if field_privacy < privacy_level:
-                return privacy_fields.get(attrname)
-        return super(UserProfile, self).__getattribute__(attrname)
-
     @classmethod
     def extract_document(cls, obj_id, obj=None):
         """Method used by elasticutils."""
-        if obj is None:
-            obj = cls.objects.get(pk=obj_id)
-        d = {}
-
-        attrs = ('id', 'is_vouched', 'website', 'ircname',
-                 'region', 'city', 'allows_mozilla_sites',
-                 'allows_community_sites')
-        for a in attrs:
-            data = getattr(obj, a)
-            if isinstance(data, basestring):
-                data = data.lower()
-            d.update({a: data})
-
-        if obj.country:
-            d.update({'country':
-                      [obj.country, COUNTRIES[obj.country].lower()]})
-
-        # user data
-        attrs = ('username', 'email', 'last_login', 'date_joined')
-        for a in attrs:
-            data = getattr(obj.user, a)
-            if isinstance(data, basestring):
-                data = data.lower()
-            d.update({a: data})
-
-        d.update(dict(fullname=obj.full_name.lower()))
-        d.update(dict(name=obj.full_name.lower()))
-        d.update(dict(bio=obj.bio))
-        d.update(dict(has_photo=bool(obj.photo)))
+        documents = cls.extract_documents([obj_id])
+        if not documents:
+            raise cls.DoesNotExist
+        return documents[0]
+
+    @classmethod
+    def extract_documents(cls, ids):
+        """Return the search documents of profiles `ids`.
+
+        Documents are built from a fixed number of queries, one for
+        the profiles and their users and one per taxonomy for the
+        memberships and the aliases of the tags.
 
+        """
+        taxonomies = {}
         for attribute in ['groups', 'skills', 'languages']:
-            groups = []
-            for g in getattr(obj, attribute).all():
-                groups.extend(g.aliases.values_list('name', flat=True))
-            d[attribute] = groups
-        return d
+            field = cls._meta.get_field(attribute)
+            profile_field = field.m2m_field_name()
+            aliases = ('%s__aliases__name' % field.m2m_reverse_field_name())
+            names = defaultdict(list)
+            for profile_id, name in (field.rel.through.objects
+                                     .filter(**{'%s__in' % profile_field: ids})
+                                     .values_list(profile_field, aliases)):
+                if name is not None:
+                    names[profile_id].append(name)
+            taxonomies[attribute] = names
+
+        documents = []
+        for obj in cls.objects.filter(id__in=ids).select_related('user'):
+            d = {}
+
+            attrs = ('id', 'is_vouched', 'website', 'ircname',
+                     'region', 'city', 'allows_mozilla_sites',
+                     'allows_community_sites', 'last_updated')
+            for a in attrs:
+                data = getattr(obj, a)
+                if isinstance(data, basestring):
+                    data = data.lower()
+                d.update({a: data})
+
+            if obj.country:
+                d.update({'country':
+                          [obj.country, COUNTRIES[obj.country].lower()]})
+
+            # user data
+            attrs = ('username', 'email', 'last_login', 'date_joined')
+            for a in attrs:
+                data = getattr(obj.user, a)
+                if isinstance(data, basestring):
+                    data = data.lower()
+                d.update({a: data})
+
+            d.update(dict(fullname=obj.full_name.lower()))
+            d.update(dict(name=obj.full_name.lower()))
+            d.update(dict(name_autocomplete=obj.full_name))
+            d.update(dict(bio=obj.bio))
+            d.update(dict(has_photo=bool(obj.photo)))
+
+            for attribute, names in taxonomies.iteritems():
+                d[attribute] = names[obj.id]
+            d['display'] = obj.get_search_display()
+            documents.append(d)
+        return documents
+
+    @classmethod
+    def get_analysis(cls):
+        """Returns the ElasticSearch analysis settings of the index."""
+        return {
+            'filter': {
+                'name_edge_ngram': {'type': 'edgeNGram',
+                                    'min_gram': 1, 'max_gram': 20}},
+            'analyzer': {
+                # Index every prefix of every word of the name, so that
+                # type-ahead searches are plain term lookups.
+                'name_autocomplete': {'type': 'custom',
+                                      'tokenizer': 'standard',
+                                      'filter': ['lowercase',
+                                                 'name_edge_ngram']}}}
 
     @classmethod
     def get_mapping(cls):
@@ -294,6 +489,9 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
                 'id': {'type': 'integer'},
                 'name': {'type': 'string', 'index': 'not_analyzed'},
                 'fullname': {'type': 'string', 'analyzer': 'standard'},
+                'name_autocomplete': {'type': 'string',
+                                      'index_analyzer': 'name_autocomplete',
+                                      'search_analyzer': 'standard'},
                 'email': {'type': 'string', 'index': 'not_analyzed'},
                 'ircname': {'type': 'string', 'index': 'not_analyzed'},
                 'username': {'type': 'string', 'index': 'not_analyzed'},
@@ -310,7 +508,8 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
                 'photo': {'type': 'boolean'},
                 'website': {'type': 'string', 'index': 'not_analyzed'},
                 'last_updated': {'type': 'date'},
-                'date_joined': {'type': 'date'}}}
+                'date_joined': {'type': 'date'},
+                'display': {'type': 'object', 'enabled': False}}}
 
     @classmethod
     def search(cls, query, include_non_vouched=False):
@@ -321,7 +520,7 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
                   'region__text', 'region__text_phrase',
                   'city__text', 'city__text_phrase',
                   'fullname__text', 'fullname__text_phrase',
-                  'fullname__prefix', 'fullname__fuzzy'
+                  'name_autocomplete__text', 'fullname__fuzzy'
                   'groups__text')
 
         if query:
@@ -330,7 +529,7 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
                  .boost(fullname__text_phrase=5, username=5, email=5,
                         ircname=5, fullname__text=4, country__text_phrase=4,
                         region__text_phrase=4, city__text_phrase=4,
-                        fullname__prefix=3, fullname__fuzzy=2,
+                        name_autocomplete__text=3, fullname__fuzzy=2,
                         bio__text=2)
                  .query(or_=q))
         else:
@@ -344,9 +543,11 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
 
     @property
     def email(self):
-        """Privacy aware email property."""
-        if self._privacy_level and self.privacy_email < self._privacy_level:
-            return self._privacy_fields['email']
+        """Privacy aware email property.
+
+        Masking is handled by PrivacyMaskDescriptor.
+
+        """
         return self.user.email
 
     @property
@@ -355,13 +556,38 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
 
     @property
     def level(self):
-        """Return user privacy clearance."""
+        """Return user privacy clearance.
+
+        The clearance is memoized on the instance, so it's resolved
+        once per request for request.user, and cached across requests
+        under a key that changes with the vouched status. Changes to
+        staff membership invalidate the cache, as do deleting or
+        merging the staff group, see invalidate_privacy_levels().
+
+        """
+        if self._level is None:
+            key = PRIVACY_LEVEL_CACHE_KEY % (
+                get_generation(PRIVACY_LEVEL_GENERATION), self.id,
+                self.is_vouched)
+            level = cache.get(key)
+            if level is None:
+                level = self._calculate_level()
+                cache.set(key, level, PRIVACY_LEVEL_CACHE_TIMEOUT)
+            self._level = level
+        return self._level
+
+    def _calculate_level(self):
         if self.groups.filter(name='staff').exists():
             return EMPLOYEES
         if self.is_vouched:
             return MOZILLIANS
         return PUBLIC
 
+    def invalidate_level(self):
+        """Forget the cached privacy clearance of this profile."""
+        self._level = None
+        invalidate_privacy_level(self.id)
+
     @property
     def is_complete(self):
         """Tests if a user has all the information needed to move on
@@ -370,8 +596,7 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
         """
         return self.display_name.strip() != ''
 
-    @property
-    def is_public(self):
+    def _calculate_is_public(self):
         """Return True is any of the privacy protected fields is PUBLIC."""
         for field in self._privacy_fields:
             if getattr(self, 'privacy_%s' % field, None) == PUBLIC:
@@ -415,43 +640,58 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
     def set_instance_privacy_level(self, level):
         """Sets privacy level of instance."""
         self._privacy_level = level
+        self._privacy_mask = self._get_privacy_mask(level)
 
     def set_privacy_level(self, level, save=True):
         """Sets all privacy enabled fields to 'level'."""
         for field in self._privacy_fields:
             setattr(self, 'privacy_%s' % field, level)
+        self.is_public = self._calculate_is_public()
+        self.set_instance_privacy_level(self._privacy_level)
         if save:
             self.save()
 
     def set_membership(self, model, membership_list):
-        """Alters membership to Groups, Skills and Languages."""
+        """Alters membership to Groups, Skills and Languages.
+
+        Names are resolved through the alias map of the model, missing
+        tags are created in bulk and memberships are changed with a
+        single remove and add on the through table. System groups are
+        never removed nor added.
+
+        """
         if model is Group:
             m2mfield = self.groups
-            alias_model = GroupAlias
         elif model is Skill:
             m2mfield = self.skills
-            alias_model = SkillAlias
         elif model is Language:
             m2mfield = self.languages
-            alias_model = LanguageAlias
-
-        # Remove any non-system groups that weren't supplied in this list.
-        m2mfield.remove(*[g for g in m2mfield.all()
-                          if g.name not in membership_list
-                          and not getattr(g, 'system', False)])
-
-        # Add/create the rest of the groups
-        groups_to_add = []
-        for g in membership_list:
-            if alias_model.objects.filter(name=g).exists():
-                group = alias_model.objects.get(name=g).alias
-            else:
-                group = model.objects.create(name=g)
 
-            if not getattr(g, 'system', False):
-                groups_to_add.append(group)
+        # membership_list holds names or, as in RegisterForm, tags.
+        names = set(unicode(name).lower() for name in membership_list)
+        tag_ids = get_alias_map(model).resolve_names(names)
+        missing = names - set(tag_ids)
+        if missing:
+            tag_ids.update(model.create_with_aliases(missing))
+        wanted = set(tag_ids.values())
+
+        if model is Group:
+            current = dict(m2mfield.values_list('id', 'system'))
+        else:
+            current = dict((tag_id, False) for tag_id in
+                           m2mfield.values_list('id', flat=True))
 
-        m2mfield.add(*groups_to_add)
+        to_remove = [tag_id for tag_id, is_system in current.iteritems()
+                     if tag_id not in wanted and not is_system]
+        to_add = wanted - set(current)
+        if model is Group and to_add:
+            to_add -= set(Group.objects.filter(id__in=to_add, system=True)
+                          .values_list('id', flat=True))
+
+        if to_remove:
+            m2mfield.remove(*to_remove)
+        if to_add:
+            m2mfield.add(*to_add)
 
     def get_photo_thumbnail(self, geometry='160x160', **kwargs):
         if 'crop' not in kwargs:
@@ -466,11 +706,129 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
         If privacy allows and no photo set, return gravatar link.
         If privacy allows and photo set return local photo link.
         If privacy doesn't allow return default local link.
+
+        Urls of the thumbnails generated on upload and of the default
+        photo are returned without touching the thumbnail store. Until
+        the thumbnails of an uploaded photo are generated, the default
+        photo is returned, so that only process_photo_task decodes
+        uploads.
         """
         if not self.photo and self.privacy_photo >= self._privacy_level:
             return gravatar(self.user.email, size=geometry)
+        if not kwargs:
+            if self.photo:
+                url = self._get_stored_thumbnails().get(geometry)
+                if url:
+                    return url
+            return get_default_photo_url(geometry)
         return self.get_photo_thumbnail(geometry, **kwargs).url
 
+    def _get_stored_thumbnails(self):
+        """Return the stored thumbnail urls of the current photo."""
+        if not self.photo_thumbnails:
+            return {}
+        thumbnails = json.loads(self.photo_thumbnails)
+        if thumbnails['photo'] != self.photo.name:
+            # Generated for a previous photo.
+            return {}
+        return thumbnails['urls']
+
+    def generate_photo_thumbnails(self):
+        """Generate thumbnails of the photo in all
+        PHOTO_THUMBNAIL_GEOMETRIES and store their urls.
+
+        """
+        if not self.photo:
+            return
+        urls = dict((geometry, self.get_photo_thumbnail(geometry).url)
+                    for geometry in PHOTO_THUMBNAIL_GEOMETRIES)
+        self.photo_thumbnails = json.dumps({'photo': self.photo.name,
+                                            'urls': urls})
+        # Leave profiles whose photo changed meanwhile alone.
+        (UserProfile.objects.filter(pk=self.pk, photo=self.photo.name)
+         .update(photo_thumbnails=self.photo_thumbnails))
+
+    def normalize_photo(self):
+        """Store the photo upright as a JPEG of at most AVATAR_SIZE,
+        without EXIF data.
+
+        Return True if the photo was replaced, False if it was already
+        normalized.
+
+        """
+        if not self.photo:
+            return False
+        old_name = self.photo.name
+        self.photo.open()
+        try:
+            image = Image.open(self.photo)
+            if (image.format == 'JPEG' and 'exif' not in image.info and
+                image.size[0] <= AVATAR_SIZE[0] and
+                image.size[1] <= AVATAR_SIZE[1]):
+                return False
+            # The orientation is lost along with the EXIF data.
+            orientation = _get_exif_orientation(image)
+            # Let the JPEG decoder downscale large photos while reading
+            # them.
+            image.draft('RGB', AVATAR_SIZE)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.split()[-1])
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+            for method in EXIF_ORIENTATION_TRANSPOSES.get(orientation, []):
+                image = image.transpose(method)
+            image.thumbnail(AVATAR_SIZE, Image.ANTIALIAS)
+            output = StringIO()
+            image.save(output, 'JPEG', quality=PHOTO_JPEG_QUALITY)
+        finally:
+            self.photo.close()
+
+        name = self.photo.storage.save(
+            _calculate_photo_filename(self, old_name),
+            ContentFile(output.getvalue()))
+        # Leave profiles whose photo changed meanwhile alone.
+        if not (UserProfile.objects.filter(pk=self.pk, photo=old_name)
+                .update(photo=name)):
+            self.photo.storage.delete(name)
+            return False
+        # The indexed cards point at thumbnails of the old photo, which
+        # are deleted along with it.
+        index_buffer.index(self.pk)
+        delete(old_name)
+        self.photo.name = name
+        return True
+
+    def get_search_display(self):
+        """Return what a search result card shows of this profile.
+
+        Privacy protected values are projected for every level a
+        viewer can have, so cards can be rendered from the search
+        document alone.
+
+        """
+        self.set_instance_privacy_level(None)
+        # Levels only differ in whether the photo is masked, so the
+        # photo url is resolved once.
+        photo_url = self.get_photo_url(SEARCH_RESULT_PHOTO_GEOMETRY)
+        levels = {}
+        for level in (EMPLOYEES, MOZILLIANS, PUBLIC):
+            self.set_instance_privacy_level(level)
+            if self.privacy_photo < level:
+                level_photo_url = get_default_photo_url(
+                    SEARCH_RESULT_PHOTO_GEOMETRY)
+            else:
+                level_photo_url = photo_url
+            levels[str(level)] = {'name': self.display_name,
+                                  'email': self.email,
+                                  'photo_url': level_photo_url}
+        self.set_instance_privacy_level(None)
+        return {'username': self.user.username,
+                'is_vouched': self.is_vouched,
+                'levels': levels}
+
     def vouch(self, vouched_by, commit=True):
         if self.is_vouched:
             return
@@ -509,11 +867,135 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
         send_mail(subject, message, settings.FROM_NOREPLY,
                   [self.user.email])
 
+    def _get_field_state(self):
+        """Return the raw values of the concrete fields by field name."""
+        state = {}
+        for field in self._meta.fields:
+            value = self.__dict__.get(field.attname)
+            # FieldFiles get updated in place, compare their names.
+            if isinstance(value, FieldFile):
+                value = value.name
+            state[field.name] = value
+        return state
+
+    def reset_changed_fields(self):
+        """Consider the current state of the profile unchanged."""
+        self._initial_state = self._get_field_state()
+        self._changed_relations = set()
+
+    def mark_changed(self, *names):
+        """Mark fields or relations as changed."""
+        self._changed_relations = self._changed_relations | set(names)
+
+    @property
+    def changed_fields(self):
+        """Return the names of the fields changed since the profile was
+        loaded or last saved.
+
+        """
+        changed = set(self._changed_relations)
+        for name, value in self._get_field_state().iteritems():
+            if self._initial_state.get(name) != value:
+                changed.add(name)
+        return changed
+
+    def has_changed(self, fields):
+        """Return True if any of `fields` has changed."""
+        return bool(self.changed_fields & fields)
+
     def save(self, *args, **kwargs):
-        self._privacy_level = None
+        created = self.pk is None
+        self.set_instance_privacy_level(None)
+        self.is_public = self._calculate_is_public()
+        self._level = None
         self.auto_vouch()
         super(UserProfile, self).save(*args, **kwargs)
-        self.add_to_staff_group()
+        if created or self.has_changed(STAFF_GROUP_FIELDS):
+            self.add_to_staff_group()
+        self.reset_changed_fields()
+
+
+_install_privacy_descriptors(UserProfile)
+
+
+def invalidate_privacy_level(profile_id):
+    """Delete the cached privacy clearances of profile `profile_id`."""
+    generation = get_generation(PRIVACY_LEVEL_GENERATION)
+    cache.delete_many([PRIVACY_LEVEL_CACHE_KEY
+                       % (generation, profile_id, is_vouched)
+                       for is_vouched in (False, True)])
+
+
+def invalidate_privacy_levels():
+    """Forget the cached privacy clearances of all profiles.
+
+    For staff membership changes which don't send m2m_changed, like
+    deleting or merging the staff group.
+
+    """
+    bump_generation(PRIVACY_LEVEL_GENERATION)
+
+
+@receiver(dbsignals.post_delete, sender=Group,
+          dispatch_uid='invalidate_privacy_levels_sig')
+def invalidate_privacy_levels_on_staff_delete(sender, instance, **kwargs):
+    if instance.name == 'staff':
+        invalidate_privacy_levels()
+
+
+@receiver(dbsignals.m2m_changed, sender=UserProfile.groups.through,
+          dispatch_uid='invalidate_privacy_level_sig')
+def invalidate_privacy_level_on_staff_change(sender, instance, action,
+                                            reverse, pk_set, **kwargs):
+    """Invalidate cached privacy clearances on staff membership changes."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.invalidate_level()
+        return
+
+    if instance.name != 'staff':
+        return
+    if action == 'pre_clear':
+        pk_set = instance.members.values_list('id', flat=True)
+    elif action not in ('post_add', 'post_remove'):
+        return
+    for profile_id in pk_set:
+        invalidate_privacy_level(profile_id)
+
+
+def get_profile_version(profile_id):
+    """Return the version of profile `profile_id`.
+
+    It changes whenever the profile, its user or its memberships do;
+    include it in the keys of cached renderings of the profile.
+
+    """
+    return get_generation(PROFILE_VERSION_GENERATION % profile_id)
+
+
+def touch_profiles(profile_ids):
+    """Bump last_updated and the version of profiles `profile_ids`.
+
+    Used for changes that don't go through UserProfile.save(), so that
+    the incremental index sync picks them up.
+
+    """
+    profile_ids = list(profile_ids)
+    if profile_ids:
+        (UserProfile.objects.filter(id__in=profile_ids)
+         .update(last_updated=datetime.now()))
+    for profile_id in profile_ids:
+        bump_generation(PROFILE_VERSION_GENERATION % profile_id)
+
+
+def _get_mirrored_state(user):
+    return tuple(user.__dict__.get(name) for name in USER_MIRRORED_FIELDS)
+
+
+@receiver(dbsignals.post_init, sender=User,
+          dispatch_uid='track_user_changes_sig')
+def track_user_changes(sender, instance, **kwargs):
+    instance._mirrored_state = _get_mirrored_state(instance)
 
 
 @receiver(dbsignals.post_save, sender=User,
@@ -521,38 +1003,116 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
 def create_user_profile(sender, instance, created, raw, **kwargs):
     if not raw:
         up, created = UserProfile.objects.get_or_create(user=instance)
-        if not created:
+        state = _get_mirrored_state(instance)
+        # Logins save the user to update last_login only.
+        if not created and state != instance.__dict__.get('_mirrored_state'):
+            up.mark_changed('user')
+            touch_profiles([up.id])
             dbsignals.post_save.send(sender=UserProfile, instance=up,
                                      created=created, raw=raw)
+        instance._mirrored_state = state
+
+
+@receiver(dbsignals.post_init, sender=UserProfile,
+          dispatch_uid='track_profile_changes_sig')
+def track_profile_changes(sender, instance, **kwargs):
+    instance.reset_changed_fields()
+
+
+_RELATIONS = dict((getattr(UserProfile, name).through, name)
+                  for name in ('groups', 'skills', 'languages'))
+
+
+def mark_relation_changed(sender, instance, action, reverse, pk_set,
+                          **kwargs):
+    """Mark profiles whose memberships changed for reindexing."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.mark_changed(_RELATIONS[sender])
+            touch_profiles([instance.id])
+        return
+
+    if action == 'pre_clear':
+        touch_profiles(instance.members.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        touch_profiles(pk_set)
+
+for through, name in _RELATIONS.items():
+    dbsignals.m2m_changed.connect(mark_relation_changed, sender=through,
+                                  dispatch_uid='mark_%s_changed_sig' % name)
+
+
+def update_member_counts(sender, instance, action, reverse, model, pk_set,
+                         **kwargs):
+    """Keep member_count of the tags whose memberships changed."""
+    if reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            type(instance).update_member_counts([instance.id])
+        return
+
+    name = _RELATIONS[sender]
+    if action == 'pre_clear':
+        instance._cleared_tag_ids = list(
+            getattr(instance, name).values_list('id', flat=True))
+    elif action == 'post_clear':
+        model.update_member_counts(instance.__dict__.pop('_cleared_tag_ids',
+                                                         []))
+    elif action in ('post_add', 'post_remove'):
+        model.update_member_counts(pk_set)
+
+for through, name in _RELATIONS.items():
+    dbsignals.m2m_changed.connect(update_member_counts, sender=through,
+                                  dispatch_uid='update_%s_counts_sig' % name)
+
+
+@receiver(dbsignals.pre_delete, sender=UserProfile,
+          dispatch_uid='remember_profile_tags_sig')
+def remember_profile_tags(sender, instance, **kwargs):
+    # Memberships are deleted without m2m_changed signals.
+    instance._deleted_tag_ids = dict(
+        (name, list(getattr(instance, name).values_list('id', flat=True)))
+        for name in _RELATIONS.values())
+
+
+@receiver(dbsignals.post_delete, sender=UserProfile,
+          dispatch_uid='update_deleted_profile_counts_sig')
+def update_deleted_profile_counts(sender, instance, **kwargs):
+    for name, ids in instance.__dict__.pop('_deleted_tag_ids', {}).items():
+        UserProfile._meta.get_field(name).rel.to.update_member_counts(ids)
+
+
+@receiver(dbsignals.post_save, sender=UserProfile,
+          dispatch_uid='bump_profile_version_sig')
+def bump_profile_version(sender, instance, **kwargs):
+    bump_generation(PROFILE_VERSION_GENERATION % instance.id)
+
+
+@receiver(dbsignals.post_save, sender=UserProfile,
+          dispatch_uid='process_photo_sig')
+def process_photo(sender, instance, created, raw, **kwargs):
+    if not raw and instance.photo and instance.has_changed(PHOTO_FIELDS):
+        process_photo_task.delay(instance.id)
 
 
 @receiver(dbsignals.post_save, sender=UserProfile,
           dispatch_uid='update_basket_sig')
-def update_basket(sender, instance, **kwargs):
-    update_basket_task.delay(instance.id)
+def update_basket(sender, instance, created, **kwargs):
+    if created or instance.has_changed(BASKET_FIELDS):
+        update_basket_task.delay(instance.id)
 
 
 @receiver(dbsignals.post_save, sender=UserProfile,
           dispatch_uid='update_search_index_sig')
-def update_search_index(sender, instance, **kwargs):
-    if instance.is_complete:
-        elasticutilstasks.index_objects.delay(sender, [instance.id])
+def update_search_index(sender, instance, created, **kwargs):
+    if (instance.is_complete and
+        (created or instance.has_changed(SEARCH_INDEX_FIELDS))):
+        index_buffer.index(instance.id)
 
 
 @receiver(dbsignals.post_delete, sender=UserProfile,
           dispatch_uid='remove_from_search_index_sig')
 def remove_from_search_index(sender, instance, **kwargs):
-    try:
-        elasticutilstasks.unindex_objects.delay(sender, [instance.id])
-    except pyes.exceptions.ElasticSearchException, e:
-        # Patch pyes
-        if (e.status == 404 and
-            isinstance(e.result, dict) and 'error' not in e.result):
-            # Item was not found, but command did not return an error.
-            # Do not worry.
-            return
-        else:
-            raise e
+    index_buffer.unindex(instance.id)
 
 
 class UsernameBlacklist(models.Model):
@@ -564,3 +1124,18 @@ class UsernameBlacklist(models.Model):
 
     class Meta:
         ordering = ['value']
+
+
+class IndexWatermark(models.Model):
+    """Position of an incremental index sync.
+
+    Everything updated up to and including (`last_updated`, `last_id`)
+    has been sent to the index.
+
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_updated = models.DateTimeField()
+    last_id = models.IntegerField(default=0)
+
+    def __unicode__(self):
+        return self.name
@@ -0,0 +1,213 @@
+import hashlib
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+
+from django_statsd.clients import statsd
+from elasticutils.contrib.django import S
+
+from apps.common.cache import bump_generation, get_generation
+
+from models import (EMPLOYEES, MOZILLIANS, SEARCH_RESULT_PHOTO_GEOMETRY,
+                    UserProfile)
+
+SEARCH_GENERATION = 'users:search'
+SEARCH_CACHE_KEY = 'users:search:%d:%s'
+SEARCH_CACHE_TIMEOUT = getattr(settings, 'SEARCH_CACHE_TIMEOUT', 600)
+AUTOCOMPLETE_CACHE_KEY = 'users:autocomplete:%d:%d:%s'
+AUTOCOMPLETE_CACHE_TIMEOUT = getattr(settings, 'AUTOCOMPLETE_CACHE_TIMEOUT',
+                                     60)
+AUTOCOMPLETE_LIMIT = 10
+
+
+SearchResultUser = namedtuple('SearchResultUser', 'username')
+
+
+def normalize_query(query):
+    """Return `query` lowercased with whitespace collapsed."""
+    return u' '.join(query.lower().split())
+
+
+def invalidate_search_cache():
+    """Forget all cached search results."""
+    bump_generation(SEARCH_GENERATION)
+
+
+def autocomplete_profiles(term, privacy_level=MOZILLIANS):
+    """Return the vouched profiles whose name has words starting with
+    the words of `term`, as seen by a viewer of `privacy_level`.
+
+    Profiles are returned as dicts with their id, name, username and
+    photo thumbnail. Answers are cached for a short while.
+
+    """
+    term = normalize_query(term)
+    if not term:
+        return []
+
+    key = AUTOCOMPLETE_CACHE_KEY % (
+        get_generation(SEARCH_GENERATION), privacy_level,
+        hashlib.md5(term.encode('utf-8')).hexdigest())
+    profiles = cache.get(key)
+    if profiles is not None:
+        statsd.incr('users.autocomplete.cache_hit')
+        return profiles
+
+    with statsd.timer('users.autocomplete.search'):
+        # One query per word; queries are combined so that all of them
+        # must match.
+        s = S(UserProfile)
+        for word in term.split():
+            s = s.query(name_autocomplete__text=word)
+        s = s.filter(is_vouched=True).order_by('_score', 'name')
+        hits = s[:AUTOCOMPLETE_LIMIT].raw()['hits']['hits']
+
+    profiles = []
+    for hit in hits:
+        display = hit['_source'].get('display')
+        if display is None:
+            continue
+        result = SearchResult(int(hit['_id']), display, privacy_level)
+        if not result.display_name:
+            continue
+        profiles.append({'id': result.id,
+                         'name': result.display_name,
+                         'username': result.user.username,
+                         'photo': result.photo_url})
+    cache.set(key, profiles, AUTOCOMPLETE_CACHE_TIMEOUT)
+    return profiles
+
+
+class SearchResult(object):
+    """Profile search hit, built from the display payload of its document.
+
+    Quacks like the UserProfile attributes used by result cards.
+
+    """
+
+    def __init__(self, profile_id, display, privacy_level):
+        # Privileged viewers see at least what employees see.
+        level = max(privacy_level, EMPLOYEES)
+        projected = display['levels'][str(level)]
+        self.id = profile_id
+        self.display_name = projected['name']
+        self.email = projected['email']
+        self.photo_url = projected['photo_url']
+        self.is_vouched = display['is_vouched']
+        self.user = SearchResultUser(display['username'])
+
+    def get_photo_url(self, geometry=SEARCH_RESULT_PHOTO_GEOMETRY):
+        if geometry != SEARCH_RESULT_PHOTO_GEOMETRY:
+            raise ValueError('Only %s photos are indexed.'
+                             % SEARCH_RESULT_PHOTO_GEOMETRY)
+        return self.photo_url
+
+
+class CachedProfileSearch(object):
+    """UserProfile search results backed by the cache.
+
+    The total and the ranked hits of every requested window are
+    cached, and invalidated whenever the index changes. Results are
+    shown as seen by a viewer of `privacy_level`. Use it with
+    SearchPaginator.
+
+    """
+
+    def __init__(self, query, include_non_vouched=False,
+                 privacy_level=MOZILLIANS):
+        self.query = normalize_query(query)
+        self.include_non_vouched = include_non_vouched
+        self.privacy_level = privacy_level
+        self.generation = get_generation(SEARCH_GENERATION)
+
+    def _key(self, window):
+        params = repr((self.query, self.include_non_vouched, window))
+        return SEARCH_CACHE_KEY % (
+            self.generation, hashlib.md5(params.encode('utf-8')).hexdigest())
+
+    def _search(self):
+        return UserProfile.search(
+            self.query, include_non_vouched=self.include_non_vouched)
+
+    def fetch(self, start, stop):
+        """Return the results ranked `start` to `stop` and the total.
+
+        Both come from a single ES request, whose result is cached.
+        Results are rendered from the display payload of the documents
+        as SearchResults. Hits are counted along with the milliseconds
+        the request took when it was cached, i.e. the time they saved.
+
+        """
+        key = self._key((start, stop))
+        cached = cache.get(key)
+        if cached is not None:
+            hits, total, took = cached
+            statsd.incr('users.search_cache.hit')
+            statsd.incr('users.search_cache.saved_ms', took)
+        else:
+            statsd.incr('users.search_cache.miss')
+            before = time.time()
+            response = self._search()[start:stop].raw()['hits']
+            took = int((time.time() - before) * 1000)
+            hits = [(int(hit['_id']), hit['_source'].get('display'))
+                    for hit in response['hits']]
+            total = response['total']
+            cache.set(key, (hits, total, took), SEARCH_CACHE_TIMEOUT)
+
+        # Documents indexed before they carried a display payload.
+        missing = [profile_id for profile_id, display in hits
+                   if display is None]
+        profiles = {}
+        if missing:
+            profiles = (UserProfile.objects.privacy_level(self.privacy_level)
+                        .select_related('user').in_bulk(missing))
+
+        results = []
+        for profile_id, display in hits:
+            if display is not None:
+                results.append(
+                    SearchResult(profile_id, display, self.privacy_level))
+            elif profile_id in profiles:
+                results.append(profiles[profile_id])
+        return results, total
+
+    def count(self):
+        return self.fetch(0, 0)[1]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, k):
+        if not isinstance(k, slice):
+            return self[k:k + 1][0]
+        return self.fetch(k.start or 0, k.stop)[0]
+
+
+class SearchPaginator(Paginator):
+    """Paginator for CachedProfileSearch.
+
+    Gets a page and the total number of results in one request,
+    instead of a count request followed by a search request.
+
+    """
+
+    def page(self, number):
+        number = self.validate_number_type(number)
+        bottom = (number - 1) * self.per_page
+        profiles, self._count = self.object_list.fetch(
+            bottom, bottom + self.per_page)
+        # Page numbers past the end raise EmptyPage.
+        number = self.validate_number(number)
+        return Page(profiles, number, self)
+
+    def validate_number_type(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
@@ -114,3 +114,48 @@ def remove_from_basket_task(instance_id):
         except (MaxRetriesExceededError, basket.BasketException):
             _email_basket_managers('subscribe', instance.user.email,
                                    exception.message)
+
+
+@task
+def index_profiles_task(ids, index=None):
+    """Index profiles `ids` in bulk."""
+    from indexing import index_profiles
+    index_profiles(ids, index=index)
+
+
+@task
+def unindex_profiles_task(ids, index=None):
+    """Remove profiles `ids` from the index in bulk."""
+    from indexing import unindex_profiles
+    unindex_profiles(ids, index=index)
+
+
+@task
+def index_all_profiles_task():
+    """Rebuild the profile index."""
+    from cron import index_all_profiles
+    index_all_profiles()
+
+
+@task
+def generate_photo_thumbnails_task(ids):
+    """Generate the photo thumbnails of profiles `ids`."""
+    from models import UserProfile
+    for profile in UserProfile.objects.filter(id__in=ids).exclude(photo=''):
+        profile.generate_photo_thumbnails()
+
+
+@task
+def process_photo_task(profile_id):
+    """Normalize the uploaded photo of profile `profile_id` and
+    generate its thumbnails.
+
+    """
+    from models import UserProfile, touch_profiles
+    try:
+        profile = UserProfile.objects.get(pk=profile_id)
+    except UserProfile.DoesNotExist:
+        return
+    if profile.normalize_photo():
+        touch_profiles([profile.id])
+    profile.generate_photo_thumbnails()
@@ -526,3 +526,45 @@ class APITests(ESTestCase):
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.content)
         self.assertEqual(len(data['objects']), 0)
+
+    def test_cursor_pagination(self):
+        """Test paging through the API with cursors."""
+        self.app.is_mozilla_app = True
+        self.app.is_active = True
+        self.app.save()
+        url = reverse('api_dispatch_list', kwargs={'api_name': 'v1',
+                                                   'resource_name': 'users'})
+
+        new_url = urlparams(url, app_name=self.app.name, app_key=self.app.key,
+                            is_vouched='true')
+        response = self.client.get(new_url, follow=True)
+        total = json.loads(response.content)['meta']['total_count']
+
+        ids = []
+        new_url = urlparams(new_url, limit=1, cursor='')
+        while new_url:
+            response = self.client.get(new_url, follow=True)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content)
+            ids.extend(obj['id'] for obj in data['objects'])
+            new_url = data['meta']['next']
+        self.assertEqual(len(ids), total)
+        self.assertEqual(ids, sorted(ids))
+
+    def test_offset_cap(self):
+        """Test that deep offsets are refused."""
+        self.app.is_mozilla_app = True
+        self.app.is_active = True
+        self.app.save()
+        url = reverse('api_dispatch_list', kwargs={'api_name': 'v1',
+                                                   'resource_name': 'users'})
+
+        new_url = urlparams(url, app_name=self.app.name, app_key=self.app.key,
+                            offset=10 ** 6)
+        response = self.client.get(new_url, follow=True)
+        self.assertEqual(response.status_code, 400)
+
+        new_url = urlparams(url, app_name=self.app.name, app_key=self.app.key,
+                            cursor='foo')
+        response = self.client.get(new_url, follow=True)
+        self.assertEqual(response.status_code, 400)
@@ -10,11 +10,12 @@ from apps.groups.models import Group
 class IncompleteProfiles(ESTestCase):
     """Test incomplete profiles."""
 
-    @patch('apps.users.models.elasticutilstasks.index_objects.delay')
+    @patch('apps.users.models.index_buffer')
     def test_not_index(self, mock_obj):
         """Test incomplete profiles indexing."""
         user()
-        self.assertFalse(mock_obj.called, 'Incomplete profile get indexed')
+        self.assertFalse(mock_obj.index.called,
+                         'Incomplete profile get indexed')
 
     def test_no_profile_page(self):
         """Test incomplete profile no profile page."""
@@ -0,0 +1,221 @@
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+
+from elasticutils.contrib.django import get_es
+from mock import patch
+from nose.tools import assert_raises, eq_, ok_
+
+from apps.common.tests.init import ESTestCase, TestCase, user
+from apps.groups.models import Group, Skill
+from apps.users.cron import (REINDEX_LOCK_KEY, index_all_profiles,
+                             index_updated_profiles)
+from apps.users.indexing import (MISSING, ORPHANED, REINDEX_STATE_KEY,
+                                 STALE, STAMP_FORMAT, IndexBuffer,
+                                 compare_index, index_profiles)
+from apps.users.models import (MOZILLIANS, PUBLIC,
+                               SEARCH_RESULT_PHOTO_GEOMETRY, IndexWatermark,
+                               UserProfile, get_default_photo_url)
+
+
+class IndexBufferTests(TestCase):
+    """Test the buffered search indexer."""
+
+    @patch('apps.users.indexing.unindex_profiles_task')
+    @patch('apps.users.indexing.index_profiles_task')
+    def test_deduplication(self, index_mock, unindex_mock):
+        buf = IndexBuffer(size=10, max_age=60)
+        for profile_id in [3, 1, 3, 2, 1]:
+            buf.index(profile_id)
+        buf.unindex(2)
+        ok_(not index_mock.delay.called)
+
+        buf.flush()
+        index_mock.delay.assert_called_once_with([1, 3])
+        unindex_mock.delay.assert_called_once_with([2])
+
+        buf.flush()
+        eq_(index_mock.delay.call_count, 1)
+
+    @patch('apps.users.indexing.index_profiles_task')
+    def test_flush_on_size(self, index_mock):
+        buf = IndexBuffer(size=2, max_age=60)
+        buf.index(1)
+        ok_(not index_mock.delay.called)
+        buf.index(2)
+        index_mock.delay.assert_called_once_with([1, 2])
+
+
+class ExtractDocumentsTests(TestCase):
+    """Test building search documents in bulk."""
+
+    def test_extract_documents(self):
+        profiles = []
+        for i in range(3):
+            profile = user(is_vouched=True).get_profile()
+            profile.full_name = 'Profile %d' % i
+            profile.save()
+            profiles.append(profile)
+        profiles[0].groups.add(Group.objects.create(name='foo'))
+        profiles[1].skills.add(Skill.objects.create(name='bar'))
+        photo = 'uploads/userprofile/cheese.jpg'
+        UserProfile.objects.filter(pk=profiles[2].pk).update(
+            photo=photo, photo_thumbnails=json.dumps(
+                {'photo': photo, 'urls': {'70x70': '/cheese-70.jpg'}}))
+        ids = [profile.id for profile in profiles]
+        # Resolved through the thumbnail store once per process.
+        default_url = get_default_photo_url(SEARCH_RESULT_PHOTO_GEOMETRY)
+
+        # One query for the profiles and their users and one per
+        # taxonomy (groups, skills and languages) for the memberships
+        # and aliases, regardless of the number of profiles. Photo
+        # urls don't touch the thumbnail store.
+        with self.assertNumQueries(4):
+            documents = UserProfile.extract_documents(ids)
+
+        documents = dict((d['id'], d) for d in documents)
+        eq_(documents[profiles[0].id]['groups'], ['foo'])
+        eq_(documents[profiles[1].id]['skills'], ['bar'])
+        eq_(documents[profiles[2].id]['languages'], [])
+        eq_(documents[profiles[2].id]['name'], 'profile 2')
+        levels = documents[profiles[2].id]['display']['levels']
+        eq_(levels[str(MOZILLIANS)]['photo_url'], '/cheese-70.jpg')
+        eq_(levels[str(PUBLIC)]['photo_url'], default_url)
+        eq_(documents[profiles[0].id],
+            UserProfile.extract_document(profiles[0].id))
+
+
+class IndexAllProfilesTests(TestCase):
+    """Test the full reindex."""
+
+    def tearDown(self):
+        cache.delete(REINDEX_STATE_KEY)
+        cache.delete(REINDEX_LOCK_KEY)
+
+    @patch('apps.users.cron.index_profiles')
+    @patch('apps.users.cron.get_es')
+    def test_resume_and_swap(self, get_es_mock, index_mock):
+        alias = settings.ES_INDEXES['default']
+        old_index = alias + '_20130101000000'
+        abandoned_index = alias + '_20130102000000'
+        new_index = alias + '_20130103000000'
+        es = get_es_mock.return_value
+        es.get_indices.return_value = {
+            old_index: {}, abandoned_index: {}, new_index: {},
+            alias + '_test': {}, alias + '_99999999999999': {}}
+        es.get_alias.return_value = [old_index]
+        last_id = self.mozillian.get_profile().id
+        cache.set(REINDEX_STATE_KEY, {'index': new_index, 'last_id': last_id})
+
+        index_all_profiles()
+
+        ok_(not es.create_index.called)
+        ids = [i for call in index_mock.call_args_list for i in call[0][0]]
+        ok_(ids)
+        ok_(all(i > last_id for i in ids))
+        eq_(ids, sorted(ids))
+        eq_(index_mock.call_args[1], {'index': new_index})
+        es.change_aliases.assert_called_once_with(
+            [('remove', old_index, alias), ('add', new_index, alias)])
+        eq_(sorted(call[0][0] for call in es.delete_index.call_args_list),
+            [old_index, abandoned_index])
+        eq_(cache.get(REINDEX_STATE_KEY), None)
+        eq_(cache.get(REINDEX_LOCK_KEY), None)
+
+    @patch('apps.users.cron.get_es')
+    def test_abandoned_checkpoint(self, get_es_mock):
+        alias = settings.ES_INDEXES['default']
+        es = get_es_mock.return_value
+        es.get_indices.return_value = {}
+        es.get_alias.return_value = []
+        cache.set(REINDEX_STATE_KEY, {'index': alias + '_20130101000000',
+                                      'last_id': 1})
+        with patch('apps.users.cron.index_profiles',
+                   side_effect=Exception):
+            assert_raises(Exception, index_all_profiles)
+
+        # The checkpoint now points to the index of the new run.
+        index = es.create_index.call_args[0][0]
+        ok_(index != alias + '_20130101000000')
+        eq_(cache.get(REINDEX_STATE_KEY), {'index': index, 'last_id': 0})
+        eq_(cache.get(REINDEX_LOCK_KEY), None)
+
+    @patch('apps.users.cron.get_es')
+    def test_lock(self, get_es_mock):
+        cache.add(REINDEX_LOCK_KEY, True)
+        index_all_profiles()
+        ok_(not get_es_mock.called)
+
+
+class IndexUpdatedProfilesTests(TestCase):
+    """Test the incremental index sync."""
+
+    @patch('apps.users.cron.INDEX_SYNC_LAG', 0)
+    @patch('apps.users.cron.index_profiles')
+    def test_sync(self, index_mock):
+        index_updated_profiles()
+        ok_(not index_mock.called)
+        watermark = IndexWatermark.objects.get(name='profiles')
+
+        past = watermark.last_updated - timedelta(days=1)
+        UserProfile.objects.update(last_updated=past)
+        profile = self.mozillian.get_profile()
+        profile.groups.add(Group.objects.create(name='foo'))
+
+        index_updated_profiles()
+        index_mock.assert_called_once_with([profile.id])
+        watermark = IndexWatermark.objects.get(name='profiles')
+        eq_(watermark.last_id, profile.id)
+
+        index_mock.reset_mock()
+        index_updated_profiles()
+        ok_(not index_mock.called)
+
+
+class CompareIndexTests(TestCase):
+    """Test the index consistency check."""
+
+    @patch('apps.users.indexing._index_stamps')
+    def test_compare_index(self, index_stamps_mock):
+        mozillian = self.mozillian.get_profile()
+        mozillian2 = self.mozillian2.get_profile()
+        pending = self.pending.get_profile()
+        index_stamps_mock.return_value = iter([
+            (mozillian.id, mozillian.last_updated.strftime(STAMP_FORMAT)),
+            (mozillian2.id, ''),
+            (pending.id + 1000, '')])
+
+        eq_(list(compare_index(page_size=1)),
+            [(STALE, mozillian2.id), (MISSING, pending.id),
+             (ORPHANED, pending.id + 1000)])
+
+
+class CompareIndexESTests(ESTestCase):
+    """Test the index consistency check against the test index."""
+
+    def test_compare_index_pages(self):
+        """Test comparing more documents than fit in a page."""
+        with patch('apps.users.models.index_buffer'):
+            profiles = []
+            for i in range(5):
+                profile = user().get_profile()
+                profile.full_name = 'Profile %d' % i
+                profile.save()
+                profiles.append(profile)
+        ids = [profile.id for profile in profiles]
+        index_profiles([ids[0], ids[1], ids[3], ids[4]])
+        get_es().refresh(settings.ES_INDEXES['default'])
+
+        UserProfile.objects.filter(pk=ids[1]).update(
+            last_updated=profiles[1].last_updated + timedelta(days=1))
+        UserProfile.objects.filter(pk=ids[3]).update(full_name='')
+
+        # Pages of two split the profiles between the sides' pages at
+        # different ids.
+        problems = [(kind, profile_id)
+                    for kind, profile_id in compare_index(page_size=2)
+                    if profile_id in ids]
+        eq_(problems, [(STALE, ids[1]), (MISSING, ids[2]),
+                       (ORPHANED, ids[3])])
@@ -1,7 +1,8 @@
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 
 from apps.common.tests.init import ESTestCase
-from apps.users.models import EMPLOYEES, PRIVILEGED, UserProfile
+from apps.users.models import (EMPLOYEES, MOZILLIANS, PRIVILEGED, PUBLIC,
+                               UserProfile)
 
 
 class PrivacyTests(ESTestCase):
@@ -14,3 +15,65 @@ class PrivacyTests(ESTestCase):
 
         for field, value in UserProfile._privacy_fields.items():
             eq_(getattr(up, field), value)
+
+    def test_instance_privacy_level(self):
+        """Test masking with set_instance_privacy_level."""
+        up = UserProfile.objects.get(user=self.mozillian2)
+        up.set_instance_privacy_level(PUBLIC)
+        eq_(up.full_name, 'Amando Brown')
+        eq_(up.email, '')
+        eq_(up.ircname, '')
+        eq_(list(up.groups.all()), [])
+
+        up.set_instance_privacy_level(MOZILLIANS)
+        eq_(up.email, self.mozillian2.email)
+
+        up.set_instance_privacy_level(None)
+        eq_(up.email, self.mozillian2.email)
+
+    def test_privacy_change(self):
+        """Test that masks follow privacy changes of the instance."""
+        up = UserProfile.objects.get(user=self.mozillian2)
+        up.set_instance_privacy_level(PUBLIC)
+        eq_(up.email, '')
+        up.privacy_email = PUBLIC
+        eq_(up.email, self.mozillian2.email)
+
+    def test_deferred_privacy_fields(self):
+        """Test masking of profiles with deferred privacy fields."""
+        up = (UserProfile.objects.privacy_level(PUBLIC)
+              .only('id', 'user', 'full_name').get(user=self.mozillian2))
+        eq_(up.full_name, 'Amando Brown')
+        eq_(up.email, '')
+
+    def test_save_clears_privacy_level(self):
+        """Test that saving a masked profile stores the real values."""
+        up = (UserProfile.objects
+              .privacy_level(PUBLIC).get(user=self.mozillian))
+        eq_(up.full_name, '')
+        up.save()
+        eq_(up.full_name, 'Amandeep McIlrath')
+        eq_(UserProfile.objects.get(user=self.mozillian).full_name,
+            'Amandeep McIlrath')
+
+    def test_values_privacy_level(self):
+        """Test masking of values() querysets."""
+        values = (UserProfile.objects.privacy_level(PUBLIC)
+                  .filter(user=self.mozillian2)
+                  .values('full_name', 'privacy_full_name',
+                          'ircname', 'privacy_ircname'))[0]
+        eq_(values['full_name'], 'Amando Brown')
+        eq_(values['ircname'], '')
+
+    def test_is_public(self):
+        """Test that is_public follows the privacy fields."""
+        up = UserProfile.objects.get(user=self.mozillian)
+        up.set_privacy_level(PUBLIC)
+        ok_(UserProfile.objects.public().filter(pk=up.pk).exists())
+
+        up.set_privacy_level(MOZILLIANS)
+        ok_(not UserProfile.objects.public().filter(pk=up.pk).exists())
+
+        up.privacy_bio = PUBLIC
+        up.save()
+        ok_(UserProfile.objects.get(pk=up.pk).is_public)
@@ -0,0 +1,95 @@
+from django.core.paginator import EmptyPage, PageNotAnInteger
+
+import jingo
+from mock import patch
+from nose.tools import assert_raises, eq_, ok_
+
+from apps.common.tests.init import TestCase
+from apps.users.models import MOZILLIANS, PUBLIC, UserProfile
+from apps.users.search import (CachedProfileSearch, SearchPaginator,
+                               SearchResult, autocomplete_profiles,
+                               invalidate_search_cache, normalize_query)
+
+
+class CachedProfileSearchTests(TestCase):
+    """Test the cached profile search."""
+
+    def setUp(self):
+        super(CachedProfileSearchTests, self).setUp()
+        invalidate_search_cache()
+
+    def test_normalize_query(self):
+        eq_(normalize_query(u'  Foo \t BAR '), u'foo bar')
+
+    @patch('apps.users.search.S')
+    def test_autocomplete_all_words(self, s_mock):
+        """Test that every word of the term has to match."""
+        s = s_mock.return_value
+        s.query.return_value = s
+        s.filter.return_value = s
+        s.order_by.return_value = s
+        s.__getitem__.return_value.raw.return_value = {'hits': {'hits': []}}
+
+        eq_(autocomplete_profiles(u'Jo  Sm'), [])
+        eq_([kwargs for args, kwargs in s.query.call_args_list],
+            [{'name_autocomplete__text': u'jo'},
+             {'name_autocomplete__text': u'sm'}])
+
+    @patch.object(CachedProfileSearch, '_search')
+    def test_cached_results(self, search_mock):
+        ids = [self.mozillian2.get_profile().id,
+               self.mozillian.get_profile().id]
+        search_mock.return_value.__getitem__.return_value.raw.return_value = {
+            'hits': {'total': 2, 'hits': [{'_id': str(i), '_source': {}}
+                                          for i in ids]}}
+
+        paginator = SearchPaginator(CachedProfileSearch(u'Amando '), 20)
+        eq_([profile.id for profile in paginator.page(1)], ids)
+        eq_(paginator.count, 2)
+        eq_(search_mock.call_count, 1)
+
+        paginator = SearchPaginator(CachedProfileSearch(u'amando'), 20)
+        eq_([profile.id for profile in paginator.page(1)], ids)
+        eq_(search_mock.call_count, 1)
+
+        invalidate_search_cache()
+        paginator = SearchPaginator(CachedProfileSearch(u'amando'), 20)
+        paginator.page(1)
+        eq_(search_mock.call_count, 2)
+
+    @patch.object(CachedProfileSearch, '_search')
+    def test_page_out_of_range(self, search_mock):
+        search_mock.return_value.__getitem__.return_value.raw.return_value = {
+            'hits': {'total': 2, 'hits': []}}
+
+        paginator = SearchPaginator(CachedProfileSearch(u'amando'), 20)
+        assert_raises(EmptyPage, paginator.page, 2)
+        assert_raises(PageNotAnInteger, paginator.page, 'foo')
+
+    @patch.object(CachedProfileSearch, '_search')
+    def test_results_from_display_payload(self, search_mock):
+        profile = self.mozillian.get_profile()
+        profile.privacy_email = MOZILLIANS
+        profile.save()
+        display = UserProfile.objects.get(id=profile.id).get_search_display()
+        search_mock.return_value.__getitem__.return_value.raw.return_value = {
+            'hits': {'total': 1, 'hits': [{'_id': str(profile.id),
+                                           '_source': {'display': display}}]}}
+
+        # Neither fetching the results nor rendering their cards
+        # touches the database or the thumbnail store.
+        with self.assertNumQueries(0):
+            result = CachedProfileSearch(u'amandeep').fetch(0, 20)[0][0]
+            card = (jingo.env.from_string('{{ search_result(profile) }}')
+                    .render(profile=result))
+        ok_(isinstance(result, SearchResult))
+        ok_(self.mozillian.username in card)
+        eq_(result.user.username, self.mozillian.username)
+        eq_(result.display_name, profile.full_name)
+        eq_(result.email, self.mozillian.email)
+        ok_(result.is_vouched)
+
+        invalidate_search_cache()
+        result = CachedProfileSearch(
+            u'amandeep', privacy_level=PUBLIC).fetch(0, 20)[0][0]
+        eq_(result.email, '')
@@ -1,18 +1,28 @@
+import json
+from datetime import datetime
+import struct
+from cStringIO import StringIO
+
 from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
 from django.test.utils import override_settings
 
 from funfactory.urlresolvers import reverse
 from mock import patch
-from nose.tools import eq_, nottest
+from nose.tools import eq_, nottest, ok_
+from PIL import Image
 from product_details import product_details
 from pyquery import PyQuery as pq
 
 from apps.common import browserid_mock
 from apps.common.tests.init import ESTestCase, user
-from apps.groups.models import Group
+from apps.groups.models import Group, Skill
+from apps.groups.utils import merge_groups
 
 from ..helpers import calculate_username, validate_username
-from ..models import UserProfile, UsernameBlacklist
+from ..models import (EMPLOYEES, MOZILLIANS, UserProfile,
+                      UsernameBlacklist)
+from ..tasks import process_photo_task
 
 
 Group.objects.get_or_create(name='staff', system=True)
@@ -280,7 +290,7 @@ class TestThingsForPeople(ESTestCase):
         assert not doc('#vouch-form button'), errmsg
         assert 'Vouch for me' not in r.content, errmsg
 
-    @patch('users.admin.index_all_profiles')
+    @patch('users.admin.tasks.index_all_profiles_task')
     def test_es_index_admin_view(self, mock_obj):
         """Test that admin:user_index_profiles work fires a re-index."""
         self.mozillian.is_superuser = True
@@ -289,7 +299,69 @@ class TestThingsForPeople(ESTestCase):
         url = reverse('admin:users_index_profiles')
         self.client.login(email=self.mozillian.email)
         self.client.get(url)
-        mock_obj.assert_any_call()
+        mock_obj.delay.assert_called_once_with()
+
+
+class ChangedFieldsTests(ESTestCase):
+    """Test that post_save side effects only run for relevant changes."""
+
+    @patch('apps.users.models.index_buffer')
+    @patch('apps.users.models.update_basket_task.delay')
+    def test_unrelated_change(self, basket_mock, index_mock):
+        profile = UserProfile.objects.get(user=self.mozillian)
+        profile.basket_token = 'exampleid'
+        profile.save()
+        ok_(not basket_mock.called)
+        ok_(not index_mock.index.called)
+
+    @patch('apps.users.models.index_buffer')
+    @patch('apps.users.models.update_basket_task.delay')
+    def test_related_change(self, basket_mock, index_mock):
+        profile = UserProfile.objects.get(user=self.mozillian)
+        profile.bio = 'I like cheese.'
+        eq_(profile.changed_fields, set(['bio']))
+        profile.save()
+        ok_(not basket_mock.called)
+        index_mock.index.assert_called_with(profile.id)
+        eq_(profile.changed_fields, set())
+
+        profile.city = 'Athens'
+        profile.save()
+        basket_mock.assert_called_with(profile.id)
+
+    @patch('apps.users.models.index_buffer')
+    @patch('apps.users.models.update_basket_task.delay')
+    def test_user_change(self, basket_mock, index_mock):
+        user = User.objects.get(pk=self.mozillian.pk)
+        user.last_login = datetime.now()
+        user.save()
+        ok_(not basket_mock.called)
+        ok_(not index_mock.index.called)
+
+        user.email = 'cheese@example.com'
+        user.save()
+        profile = user.get_profile()
+        basket_mock.assert_called_with(profile.id)
+        index_mock.index.assert_called_with(profile.id)
+
+    @patch('apps.users.models.index_buffer')
+    def test_membership_change(self, index_mock):
+        profile = UserProfile.objects.get(user=self.mozillian)
+        profile.skills.add(Skill.objects.create(name='cheese'))
+        eq_(profile.changed_fields, set(['skills']))
+        profile.save()
+        index_mock.index.assert_called_with(profile.id)
+
+    @patch('apps.users.models.process_photo_task.delay')
+    def test_photo_change(self, photo_mock):
+        profile = UserProfile.objects.get(user=self.mozillian)
+        profile.bio = 'I like cheese.'
+        profile.save()
+        ok_(not photo_mock.called)
+
+        profile.photo = 'uploads/userprofile/cheese.jpg'
+        profile.save()
+        photo_mock.assert_called_with(profile.id)
 
 
 class VouchTest(ESTestCase):
@@ -370,6 +442,94 @@ class TestUser(ESTestCase):
         p.ircname = ''
         eq_(p.ircname, '', 'We need to allow IRCname to be blank')
 
+    @patch('apps.users.models.get_default_photo_url')
+    @patch('apps.users.models.get_thumbnail')
+    def test_stored_photo_thumbnails(self, thumbnail_mock, default_mock):
+        """Test that stored thumbnail urls of the photo are used, and
+        that the default photo is used until they are generated.
+
+        """
+        default_mock.return_value = '/default.jpg'
+        profile = UserProfile.objects.get(user=self.mozillian)
+        profile.photo = 'uploads/userprofile/cheese.jpg'
+        profile.photo_thumbnails = json.dumps(
+            {'photo': 'uploads/userprofile/cheese.jpg',
+             'urls': {'70x70': '/stored.jpg'}})
+        eq_(profile.get_photo_url('70x70'), '/stored.jpg')
+        eq_(profile.get_photo_url('160x160'), '/default.jpg')
+
+        profile.photo = 'uploads/userprofile/new.jpg'
+        eq_(profile.get_photo_url('70x70'), '/default.jpg')
+        ok_(not thumbnail_mock.called)
+
+    @patch('apps.users.models.process_photo_task.delay')
+    def test_normalize_rotated_photo(self, photo_mock):
+        """Test that photos are stored upright, small and without EXIF
+        data.
+
+        """
+        output = StringIO()
+        Image.new('RGB', (800, 400), (255, 0, 0)).save(output, 'JPEG')
+        data = output.getvalue()
+        # Little endian TIFF header followed by a single IFD entry: the
+        # orientation tag, a SHORT of 6, i.e. rotated by 90 degrees.
+        exif = ('Exif\x00\x00II*\x00\x08\x00\x00\x00\x01\x00'
+                '\x12\x01\x03\x00\x01\x00\x00\x00\x06\x00\x00\x00'
+                '\x00\x00\x00\x00')
+        data = (data[:2] + '\xff\xe1' + struct.pack('>H', len(exif) + 2) +
+                exif + data[2:])
+
+        profile = UserProfile.objects.get(user=self.mozillian)
+        profile.photo.save('rotated.jpg', ContentFile(data))
+        photo_mock.assert_called_with(profile.id)
+        uploaded = profile.photo.name
+
+        with patch('apps.users.models.index_buffer') as index_mock:
+            process_photo_task(profile.id)
+        index_mock.index.assert_called_with(profile.id)
+        profile = UserProfile.objects.get(pk=profile.pk)
+        ok_(profile.photo.name != uploaded)
+        ok_(not profile.photo.storage.exists(uploaded))
+        image = Image.open(profile.photo)
+        eq_(image.format, 'JPEG')
+        eq_(image.size, (150, 300))
+        ok_('exif' not in image.info)
+        ok_(not profile.normalize_photo())
+        profile.photo.delete(save=False)
+
+    def test_level_follows_staff_membership(self):
+        """Test that the cached privacy level follows staff membership."""
+        staff, created = Group.objects.get_or_create(name='staff',
+                                                     system=True)
+        profile = UserProfile.objects.get(user=self.mozillian)
+        eq_(profile.level, MOZILLIANS)
+
+        profile.groups.add(staff)
+        eq_(profile.level, EMPLOYEES)
+        eq_(UserProfile.objects.get(pk=profile.pk).level, EMPLOYEES)
+
+        staff.members.remove(profile)
+        eq_(UserProfile.objects.get(pk=profile.pk).level, MOZILLIANS)
+
+    @patch('apps.users.tasks.index_profiles_task.delay')
+    def test_level_follows_staff_group(self, index_mock):
+        """Test that the cached privacy level follows merges and
+        deletions of the staff group.
+
+        """
+        staff, created = Group.objects.get_or_create(name='staff',
+                                                     system=True)
+        profile = UserProfile.objects.get(user=self.mozillian)
+        group = Group.objects.create(name='cheese')
+        profile.groups.add(group)
+        eq_(profile.level, MOZILLIANS)
+
+        merge_groups(staff, [group])
+        eq_(UserProfile.objects.get(pk=profile.pk).level, EMPLOYEES)
+
+        staff.delete()
+        eq_(UserProfile.objects.get(pk=profile.pk).level, MOZILLIANS)
+
 
 class TestMigrateRegistration(ESTestCase):
         """Test funky behavior of flee ldap."""
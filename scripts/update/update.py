@@ -53,6 +53,12 @@ def update_es_indexes(ctx):
         ctx.local("python2.6 manage.py cron index_all_profiles")
 
 
+@task
+def update_member_counts(ctx):
+    with ctx.lcd(settings.SRC_DIR):
+        ctx.local("python2.6 manage.py cron update_member_counts")
+
+
 #@task
 #def install_cron(ctx):
 #    with ctx.lcd(settings.SRC_DIR):
@@ -119,6 +125,7 @@ def deploy(ctx):
     prime_app()
     update_celery()
     update_es_indexes()
+    update_member_counts()
 
 
 @task
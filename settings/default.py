@@ -75,6 +75,13 @@ JINGO_EXCLUDE_APPS = [
     'autocomplete_light'
 ]
 
+
+def JINJA_CONFIG():
+    config = base.JINJA_CONFIG()
+    config['extensions'].append('apps.common.fragments.FragmentCacheExtension')
+    return config
+
+
 MINIFY_BUNDLES = {
     'css': {
         'common': (
@@ -313,3 +320,8 @@ DEFAULT_AVATAR_URL = urljoin(MEDIA_URL, DEFAULT_AVATAR)
 DEFAULT_AVATAR_PATH = os.path.join(MEDIA_ROOT, DEFAULT_AVATAR)
 
 CELERYBEAT_SCHEDULER = "djcelery.schedulers.DatabaseScheduler"
+
+# Stream uploads to temporary files instead of keeping them in memory.
+# Photos are moved into place from there and normalized by a task.
+FILE_UPLOAD_HANDLERS = (
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',)
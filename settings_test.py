@@ -1,3 +1,9 @@
 ES_INDEXES = {'default': 'mozillians_test'}
 ES_DISABLED = True
 ES_TIMEOUT = 60
+# Send profiles to the index as soon as they are saved.
+ES_INDEX_BUFFER_SIZE = 1
+# Tests run in a transaction that other threads can't see.
+BACKGROUND_WORKERS = 0
+# Check the autocomplete indexes for changes on every lookup.
+AUTOCOMPLETE_INDEX_CHECK_INTERVAL = 0